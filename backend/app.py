@@ -52,15 +52,34 @@ async def lifespan(app: FastAPI):
                 logger.error(f"Periodic cleanup failed: {e}")
 
     cleanup_task = asyncio.create_task(periodic_cleanup())
+
+    # Sweep expired tokens on a timer instead of on every token creation
+    from backend.services.token_service import token_service, CLEANUP_INTERVAL
+
+    async def periodic_token_cleanup():
+        while True:
+            await asyncio.sleep(CLEANUP_INTERVAL)
+            token_service.cleanup()
+
+    token_cleanup_task = asyncio.create_task(periodic_token_cleanup())
     
     yield
     
-    # Shutdown: Cancel cleanup task
-    cleanup_task.cancel()
-    try:
-        await cleanup_task
-    except asyncio.CancelledError:
-        pass
+    # Shutdown: Cancel cleanup tasks
+    for task in (cleanup_task, token_cleanup_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    # Shutdown: Persist buffered TUS upload offsets
+    from backend.routes.tus import metadata_store
+    metadata_store.flush_pending()
+
+    # Shutdown: Stop thumbnail worker processes
+    from backend.services.thumbnail_service import thumbnail_service
+    thumbnail_service.shutdown()
 
     # Shutdown: Close database connections
     await close_all()
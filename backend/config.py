@@ -64,6 +64,8 @@ class LogicConfig(BaseModel):
     max_url_records: int = 30
     max_content_length: Optional[int] = None
     allowed_extensions: Optional[list[str]] = None
+    # Max directories listed concurrently during disk scans
+    stat_concurrency: int = 64
 
 
 
@@ -1,11 +1,11 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from fastapi import APIRouter, HTTPException, Request, Form, UploadFile, File, Depends
 from fastapi.responses import FileResponse, JSONResponse
 from starlette.background import BackgroundTask
 from backend.services.user_service import user_service
 from backend.services.file_service import file_service
 from backend.services.note_service import note_service
-from backend.services.token_service import token_service
+from backend.services.token_service import token_service, TokenType
 from backend.services.audit_service import AuditService
 from backend.services.event_service import event_service
 from backend.services.thumbnail_service import thumbnail_service
@@ -21,7 +21,9 @@ router = APIRouter()
 audit_service = AuditService(os.path.join(settings.paths.user_info_file.parent, "audit_logs.json"))
 
 
-@router.get("/files/{username}", response_model=List[FileInfo])
+# Entries come straight from the files index and already match FileInfo, so
+# they are sent as-is; the schema is kept only for the OpenAPI docs.
+@router.get("/files/{username}", responses={200: {"model": List[FileInfo]}})
 async def get_files(username: str, token: Optional[str] = None):
     """List files for a specific user."""
     user = await user_service.get_user_by_name(username)
@@ -36,10 +38,11 @@ async def get_files(username: str, token: Optional[str] = None):
         if not info or info.username != username:
             raise HTTPException(status_code=403, detail="無效或過期的存取權杖")
 
-    return await file_service.get_user_files(
+    files = await file_service.get_user_files(
         user["folder"],
         retention_days=user.get("data_retention_days"),
     )
+    return JSONResponse(content=files)
 
 
 @router.post("/upload")
@@ -369,10 +372,10 @@ async def download_direct(
         info = token_service.validate_token(token)
         if not info or info.username != username:
             # Check share token (must match filename) OR session token (must match username)
-            is_valid_share = (info and info.token_type == 'share' 
+            is_valid_share = (info and info.token_type is TokenType.SHARE 
                             and info.filename == filename and info.username == username)
-            is_valid_session = (info and info.token_type == 'session' and info.username == username)
-            is_valid_access = (info and info.token_type == 'access' and info.username == username)
+            is_valid_session = (info and info.token_type is TokenType.SESSION and info.username == username)
+            is_valid_access = (info and info.token_type is TokenType.ACCESS and info.username == username)
 
             if not (is_valid_share or is_valid_session or is_valid_access):
                 raise HTTPException(status_code=403, detail="無效或過期的存取權杖")
@@ -425,9 +428,9 @@ async def get_thumbnail(
         
         info = token_service.validate_token(token)
         if not info or info.username != username:
-            is_valid_share = (info and info.token_type == 'share' 
+            is_valid_share = (info and info.token_type is TokenType.SHARE 
                             and info.filename == filename and info.username == username)
-            is_valid_session = (info and info.token_type == 'session' and info.username == username)
+            is_valid_session = (info and info.token_type is TokenType.SESSION and info.username == username)
 
             if not (is_valid_share or is_valid_session):
                 raise HTTPException(status_code=403, detail="Invalid token")
@@ -673,6 +676,7 @@ async def move_item(
                     await loop.run_in_executor(
                         None, shutil.move, str(old_dir), str(new_dir)
                     )
+                    file_service.invalidate_dir_cache(old_dir)
                 except Exception as e:
                     raise HTTPException(
                         status_code=500,
@@ -715,6 +719,18 @@ async def batch_action(
     success_count = 0
     errors = []
 
+    # URL lock state is pure DB work: one batched statement and one commit
+    # instead of a commit per item.
+    if data.item_type == "url" and data.action in ("lock", "unlock"):
+        try:
+            success_count = await note_service.batch_lock_urls(
+                username, data.item_ids, data.action == "lock"
+            )
+        except Exception as e:
+            errors.append(str(e))
+        await event_service.notify_user_update(username)
+        return {"message": f"成功處理 {success_count} 個項目", "errors": errors}
+
     for item_id in data.item_ids:
         try:
             if data.action == "delete":
@@ -795,33 +811,30 @@ async def batch_download(
         if not auth_success:
             raise HTTPException(status_code=403, detail="部分檔案已鎖定或目錄已加密，需要驗證")
 
-    import tempfile
-    import zipfile
-
-    temp_zip = tempfile.NamedTemporaryFile(suffix=".zip", delete=False)
-    temp_zip_path = temp_zip.name
-    temp_zip.close()
-
     from backend.services.database import get_files_db
     db = await get_files_db()
 
-    with zipfile.ZipFile(temp_zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        for fname in filenames:
-            cursor = await db.execute(
-                "SELECT folder_id FROM files WHERE username = ? AND filename = ?",
-                (user["folder"], fname),
-            )
-            row = await cursor.fetchone()
-            fid = row["folder_id"] if row else None
+    # Files usually share a handful of folders; resolve each folder once
+    path_cache: Dict[Optional[str], List[str]] = {}
+
+    entries = []
+    for fname in filenames:
+        cursor = await db.execute(
+            "SELECT folder_id FROM files WHERE username = ? AND filename = ?",
+            (user["folder"], fname),
+        )
+        row = await cursor.fetchone()
+        fid = row["folder_id"] if row else None
+        path_names = path_cache.get(fid)
+        if path_names is None:
             path_names = await user_service.get_folder_path_names(username, fid)
-            folder_path = file_service._get_folder_path(user["folder"], path_names)
-            file_path = folder_path / fname
+            path_cache[fid] = path_names
+        folder_path = file_service._get_folder_path(user["folder"], path_names)
+        arcname = os.path.join(*path_names, fname) if path_names else fname
+        entries.append((folder_path / fname, arcname))
 
-            if file_path.exists():
-                arcname = (
-                    os.path.join(*path_names, fname) if path_names else fname
-                )
-                zf.write(file_path, arcname=arcname)
+    # Compression runs in the thread pool, not on the event loop
+    temp_zip_path = await file_service.create_zip(entries)
 
     return FileResponse(
         path=temp_zip_path,
@@ -857,15 +870,21 @@ async def download_folder(
     all_folders = await user_service.get_folders_by_username(username)
     folder_map = {f["id"]: f for f in all_folders}
     
-    # 1. Identify all descendant folder IDs
+    # 1. Identify all descendant folder IDs (index children once so the
+    # walk is linear in the number of folders)
+    children: Dict[str, List[str]] = {}
+    for f in all_folders:
+        if f["parent_id"]:
+            children.setdefault(f["parent_id"], []).append(f["id"])
+
     descendants = set()
     stack = [folder_id]
     while stack:
         current_id = stack.pop()
+        if current_id in descendants:
+            continue
         descendants.add(current_id)
-        for f in all_folders:
-            if f["parent_id"] == current_id:
-                stack.append(f["id"])
+        stack.extend(children.get(current_id, ()))
 
     # 2. Check locks in descendants if unauthenticated
     if not is_authenticated:
@@ -886,22 +905,25 @@ async def download_folder(
                 raise HTTPException(status_code=403, detail="Contains locked files")
 
     # 4. Create Zip
-    import tempfile
-    import zipfile
+    # Helper: resolve path from root, memoized so each folder's parent chain
+    # is walked once no matter how many files live under it
+    resolved: Dict[str, Tuple[str, ...]] = {}
 
-    temp_zip = tempfile.NamedTemporaryFile(suffix=".zip", delete=False)
-    temp_zip_path = temp_zip.name
-    temp_zip.close()
-
-    # Helper: resolve path from root
     def get_path_from_root(fid):
-        path = []
+        chain = []
+        seen = set()
         curr = fid
-        while curr and curr in folder_map:
-            f = folder_map[curr]
-            path.insert(0, f["name"])
-            curr = f["parent_id"]
-        return path
+        while curr and curr in folder_map and curr not in resolved:
+            if curr in seen:  # Corrupt parent cycle; stop climbing
+                break
+            seen.add(curr)
+            chain.append(curr)
+            curr = folder_map[curr]["parent_id"]
+        path = resolved.get(curr, ())
+        for cid in reversed(chain):
+            path = path + (folder_map[cid]["name"],)
+            resolved[cid] = path
+        return list(resolved.get(fid, path))
 
     target_root_path = get_path_from_root(folder_id)
     # The number of path components to strip to make paths relative to the zip root
@@ -910,23 +932,24 @@ async def download_folder(
     # If we want "B/...", we strip "A". Length of target_root_path is 2. Strip 1.
     strip_count = max(0, len(target_root_path) - 1)
 
-    with zipfile.ZipFile(temp_zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        for file_info in target_files:
-            fname = file_info["name"]
-            fid = file_info["folder_id"]
-            
-            # Physical path needs names from root
-            full_path_names = get_path_from_root(fid)
-            
-            # Get physical path
-            folder_path = file_service._get_folder_path(user["folder"], full_path_names)
-            file_path = folder_path / fname
-            
-            if file_path.exists():
-                # Archive path: relative to the parent of the target folder
-                rel_path_names = full_path_names[strip_count:]
-                arcname = os.path.join(*rel_path_names, fname)
-                zf.write(file_path, arcname=arcname)
+    entries = []
+    for file_info in target_files:
+        fname = file_info["name"]
+        fid = file_info["folder_id"]
+
+        # Physical path needs names from root
+        full_path_names = get_path_from_root(fid)
+
+        # Get physical path
+        folder_path = file_service._get_folder_path(user["folder"], full_path_names)
+
+        # Archive path: relative to the parent of the target folder
+        rel_path_names = full_path_names[strip_count:]
+        arcname = os.path.join(*rel_path_names, fname)
+        entries.append((folder_path / fname, arcname))
+
+    # Compression runs in the thread pool, not on the event loop
+    temp_zip_path = await file_service.create_zip(entries)
 
     return FileResponse(
         path=temp_zip_path,
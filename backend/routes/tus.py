@@ -9,7 +9,9 @@ from fastapi import APIRouter, Request
 from fastapi.responses import Response
 from starlette.requests import ClientDisconnect
 from fastapi import HTTPException, Header, status
-from typing import Optional
+from typing import Dict, Optional
+import asyncio
+import threading
 import uuid
 import base64
 import logging
@@ -25,7 +27,6 @@ from backend.core.rate_limit import limiter
 
 from fastapi import BackgroundTasks
 import os
-import aiofiles
 
 logger = logging.getLogger(__name__)
 
@@ -34,12 +35,95 @@ router = APIRouter(prefix="/api")
 # TUS Protocol Constants
 TUS_VERSION = "1.0.0"
 CHUNK_SIZE = 5 * 1024 * 1024  # 5MB chunks (aligned with R2 Multipart)
+# Temp files kept open between PATCH requests; idle ones are closed beyond this
+MAX_OPEN_DATA_FILES = 256
+_O_BINARY = getattr(os, "O_BINARY", 0)
 
 # Initialize services
 metadata_store = TusMetadataStore()
 audit_service = AuditService(os.path.join(settings.paths.user_info_file.parent, "audit_logs.json"))
 # event_service imported as singleton
 
+# upload_id -> write fd of its temp file, oldest first. Guarded by _fds_lock
+# because stale-upload cleanup runs in the threadpool.
+_data_fds: Dict[str, int] = {}
+_fds_lock = threading.Lock()
+# upload_id -> lock held by a PATCH for as long as it uses the upload's fd
+_upload_locks: Dict[str, asyncio.Lock] = {}
+
+
+def _upload_lock(upload_id: str) -> asyncio.Lock:
+    """Return the lock serializing writes to an upload."""
+    lock = _upload_locks.get(upload_id)
+    if lock is None:
+        lock = _upload_locks[upload_id] = asyncio.Lock()
+    return lock
+
+
+def _is_busy(upload_id: str) -> bool:
+    """True while a PATCH holds the upload's lock (and may be using its fd)."""
+    lock = _upload_locks.get(upload_id)
+    return lock is not None and lock.locked()
+
+
+def _get_data_fd(upload_id: str, create: bool = False) -> int:
+    """Return the cached write fd for an upload's temp file, opening it if needed.
+
+    Must be called with the upload's lock held, or before the upload is
+    visible to clients.
+
+    Args:
+        upload_id: The upload.
+        create: Create the temp file if it does not exist.
+    """
+    with _fds_lock:
+        fd = _data_fds.get(upload_id)
+        if fd is None:
+            if len(_data_fds) >= MAX_OPEN_DATA_FILES:
+                # Close the oldest fd that no PATCH is writing through; if all
+                # are busy, go over the limit rather than pull one from under a write
+                idle = next((uid for uid in _data_fds if not _is_busy(uid)), None)
+                if idle is not None:
+                    os.close(_data_fds.pop(idle))
+            flags = os.O_WRONLY | _O_BINARY
+            if create:
+                flags |= os.O_CREAT
+            fd = os.open(settings.paths.tus_temp_folder / upload_id, flags, 0o644)
+            _data_fds[upload_id] = fd
+        return fd
+
+
+def _create_data_file(upload_id: str) -> None:
+    """Create an upload's empty temp file and cache its fd (run in the executor)."""
+    settings.paths.tus_temp_folder.mkdir(parents=True, exist_ok=True)
+    _get_data_fd(upload_id, create=True)
+
+
+def _release_upload(upload_id: str) -> None:
+    """Close an upload's cached fd and drop its lock once it is finished or gone."""
+    with _fds_lock:
+        if _is_busy(upload_id):
+            return  # Mid-write; eviction closes the fd later
+        fd = _data_fds.pop(upload_id, None)
+        if fd is not None:
+            os.close(fd)
+    _upload_locks.pop(upload_id, None)
+
+
+def _pwrite_all(fd: int, data: bytes, offset: int) -> None:
+    """Write the whole buffer to fd at offset, continuing after short writes."""
+    view = memoryview(data)
+    if not hasattr(os, "pwrite"):
+        # Windows: seek + write; callers hold the upload's lock
+        os.lseek(fd, offset, os.SEEK_SET)
+        while view:
+            view = view[os.write(fd, view):]
+        return
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
 
 def parse_tus_metadata(metadata_header: Optional[str]) -> dict:
     """Parse TUS Upload-Metadata header (Base64-encoded key-value pairs)."""
@@ -48,10 +132,9 @@ def parse_tus_metadata(metadata_header: Optional[str]) -> dict:
     
     result = {}
     for pair in metadata_header.split(','):
-        pair = pair.strip()
-        if ' ' not in pair:
+        key, sep, value = pair.strip().partition(' ')
+        if not sep:
             continue
-        key, value = pair.split(' ', 1)
         try:
             decoded = base64.b64decode(value).decode('utf-8')
             result[key] = decoded
@@ -83,17 +166,14 @@ async def finalize_upload_local(upload: dict):
     try:
         # 1. Path to temp file
         temp_path = settings.paths.tus_temp_folder / upload_id
-        
-        if not temp_path.exists():
-             logger.error(f"Temp file not found: {temp_path}")
-             return
 
         # 2. Import to user folder (dedup & move)
-        # This is an instant move on same filesystem
+        # This is an instant move on same filesystem; import_file returns
+        # None if the temp file is missing
         final_name = await file_service.import_file(temp_path, username, filename)
         
         if not final_name:
-            logger.error(f"Failed to import file to user folder: {filename}")
+            logger.error(f"Failed to import file to user folder: {filename} ({temp_path})")
             return
             
         logger.info(f"File imported successfully as: {final_name}")
@@ -164,11 +244,11 @@ async def create_tus_upload(
         # Create new upload
         upload_id = str(uuid.uuid4())
         
-        # Create empty file
+        # Create empty file, keeping its fd open for the first PATCH
         file_path = settings.paths.tus_temp_folder / upload_id
+        loop = asyncio.get_event_loop()
         try:
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            file_path.touch()
+            await loop.run_in_executor(None, _create_data_file, upload_id)
         except Exception as e:
             logger.error(f"Failed to create temp file: {e}")
             raise HTTPException(status_code=500, detail="Failed to initialize upload storage")
@@ -186,7 +266,8 @@ async def create_tus_upload(
         
         if not created:
              # Cleanup
-             file_path.unlink(missing_ok=True)
+             _release_upload(upload_id)
+             await loop.run_in_executor(None, lambda: file_path.unlink(missing_ok=True))
              raise HTTPException(status_code=500, detail="Failed to create upload session")
             
         logger.info(f"Created Local TUS upload: {upload_id} for {filename}")
@@ -256,11 +337,6 @@ async def upload_tus_chunk(
             detail=f"Offset mismatch. Expected {current_offset}, got {upload_offset}"
         )
         
-    # File path
-    file_path = settings.paths.tus_temp_folder / upload_id
-    if not file_path.exists():
-         raise HTTPException(status_code=404, detail="Upload file not found on server")
-
     # Read chunk
     try:
         chunk = await request.body()
@@ -274,17 +350,34 @@ async def upload_tus_chunk(
     if current_offset + chunk_size > upload['size']:
          raise HTTPException(status_code=400, detail="Upload exceeds total size")
 
-    # Append to file
-    try:
-        async with aiofiles.open(file_path, 'ab') as f:
-            await f.write(chunk)
-    except Exception as e:
-        logger.error(f"Write error for {upload_id}: {e}")
-        raise HTTPException(status_code=500, detail="Failed to write chunk")
+    async with _upload_lock(upload_id):
+        # Re-check under the lock: a concurrent PATCH for the same offset may
+        # have been written while this body was being received
+        upload = metadata_store.get_upload(upload_id)
+        if not upload:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        if upload['offset'] != current_offset:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Offset mismatch. Expected {upload['offset']}, got {upload_offset}"
+            )
+
+        # Write at the client's offset through the upload's long-lived fd, so
+        # a chunk resent after a lost offset update overwrites, not duplicates
+        try:
+            fd = _get_data_fd(upload_id)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Upload file not found on server")
+        try:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, _pwrite_all, fd, chunk, upload_offset)
+        except Exception as e:
+            logger.error(f"Write error for {upload_id}: {e}")
+            raise HTTPException(status_code=500, detail="Failed to write chunk")
 
-    # Update metadata
-    new_offset = current_offset + chunk_size
-    metadata_store.update_offset(upload_id, new_offset, parts=[]) # Parts no longer needed for local
+        # Update metadata
+        new_offset = current_offset + chunk_size
+        metadata_store.update_offset(upload_id, new_offset, parts=[]) # Parts no longer needed for local
     
     logger.info(f"TUS Chunk {upload_id}: +{chunk_size} bytes, new_offset={new_offset}")
 
@@ -292,6 +385,8 @@ async def upload_tus_chunk(
     if new_offset == upload['size']:
         logger.info(f"TUS Complete (Local): {upload_id}")
         metadata_store.mark_completed(upload_id)
+        # Close the fd before the move (Windows cannot rename an open file)
+        _release_upload(upload_id)
         # Trigger finalization (can be awaited or background, strictly speaking instant move is fast enough)
         background_tasks.add_task(finalize_upload_local, upload)
     
@@ -321,14 +416,17 @@ async def cancel_tus_upload(
     
     # Abort local upload
     metadata_store.mark_aborted(upload_id)
+    _release_upload(upload_id)
     
     file_path = settings.paths.tus_temp_folder / upload_id
-    if file_path.exists():
-        try:
-            file_path.unlink()
-            logger.info(f"Deleted temp file for aborted upload: {upload_id}")
-        except Exception as e:
-            logger.error(f"Failed to delete temp file: {e}")
+    try:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, file_path.unlink)
+        logger.info(f"Deleted temp file for aborted upload: {upload_id}")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Failed to delete temp file: {e}")
     
     return Response(
         status_code=204,
@@ -337,20 +435,25 @@ async def cancel_tus_upload(
 
 
 def cleanup_expired_uploads():
-    """Cleanup stale TUS uploads (DB + Files)."""
+    """Cleanup stale TUS uploads (DB + Files).
+
+    Blocking; app.py runs it in the threadpool.
+    """
     try:
         # 1 day expiration
         expired_ids = metadata_store.cleanup_stale_uploads(days=1)
         
         count = 0
         for uid in expired_ids:
+            _release_upload(uid)
             file_path = settings.paths.tus_temp_folder / uid
-            if file_path.exists():
-                try:
-                    file_path.unlink()
-                    count += 1
-                except Exception as e:
-                    logger.error(f"Failed to delete stale file {uid}: {e}")
+            try:
+                file_path.unlink()
+                count += 1
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Failed to delete stale file {uid}: {e}")
         
         if expired_ids:
             logger.info(f"Cleaned up {len(expired_ids)} stale uploads and {count} files.")
@@ -142,14 +142,14 @@ async def migrate() -> None:
 
                     await files_db.execute(
                         "INSERT OR IGNORE INTO files "
-                        "(username, filename, folder_id, size_bytes, created_at, is_locked) "
+                        "(username, filename, folder_id, size_bytes, created_ts, is_locked) "
                         "VALUES (?, ?, ?, ?, ?, ?)",
                         (
                             user_folder,
                             filename,
                             fid,
                             stat.st_size,
-                            datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                            int(stat.st_mtime),
                             is_locked,
                         ),
                     )
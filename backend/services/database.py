@@ -9,6 +9,7 @@ Manages 3 independent SQLite databases via aiosqlite:
 
 import aiosqlite
 import logging
+from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
@@ -73,7 +74,7 @@ CREATE TABLE IF NOT EXISTS files (
     filename TEXT NOT NULL,
     folder_id TEXT,
     size_bytes INTEGER NOT NULL DEFAULT 0,
-    created_at TEXT NOT NULL,
+    created_ts INTEGER NOT NULL,
     is_locked INTEGER NOT NULL DEFAULT 0,
     UNIQUE(username, filename)
 );
@@ -90,6 +91,11 @@ CREATE INDEX IF NOT EXISTS idx_files_username_filename ON files(username, filena
 async def _open_connection(db_path: Path) -> aiosqlite.Connection:
     """Open a connection with WAL mode and FK enforcement.
 
+    ``synchronous=NORMAL`` is safe under WAL (a crash can only lose the
+    most recent commits, never corrupt the file) and drops the per-commit
+    fsync.  Parsed statements are reused through sqlite3's own per-
+    connection statement cache, which is keyed by SQL text.
+
     Args:
         db_path: Absolute path to the SQLite database file.
 
@@ -99,6 +105,8 @@ async def _open_connection(db_path: Path) -> aiosqlite.Connection:
     conn = await aiosqlite.connect(str(db_path))
     conn.row_factory = aiosqlite.Row
     await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    await conn.execute("PRAGMA temp_store=MEMORY")
     await conn.execute("PRAGMA foreign_keys=ON")
     return conn
 
@@ -127,6 +135,66 @@ async def get_files_db() -> aiosqlite.Connection:
     return _files_conn
 
 
+# ------------------------------------------------------------------
+# Migrations
+# ------------------------------------------------------------------
+
+def _iso_to_ts(value: Optional[str], fallback: int) -> int:
+    """Convert a legacy local-time ISO string to unix seconds.
+
+    Missing or unparseable values return ``fallback`` rather than 0, which
+    would make the file look like it was uploaded in 1970.
+    """
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except (TypeError, ValueError):
+        return fallback
+
+
+async def _migrate_files_created_ts(conn: aiosqlite.Connection) -> None:
+    """Replace the legacy TEXT ``files.created_at`` with INTEGER ``created_ts``.
+
+    SQLite cannot change a column type in place, so the table is rebuilt.
+    The conversion runs in Python because the stored strings are naive
+    local times, which SQLite's strftime('%s') would read as UTC.
+    Rows whose value cannot be parsed get the migration time.
+
+    Args:
+        conn: The files.db connection.
+    """
+    cursor = await conn.execute("PRAGMA table_info(files)")
+    columns = {row[1] for row in await cursor.fetchall()}
+    if "created_at" not in columns:
+        return
+
+    logger.info("Migrating files.created_at to integer created_ts...")
+    migrated_ts = int(datetime.now().timestamp())
+    await conn.create_function(
+        "iso_to_ts", 1, lambda value: _iso_to_ts(value, migrated_ts), deterministic=True
+    )
+    await conn.executescript("""
+        BEGIN;
+        CREATE TABLE files_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            folder_id TEXT,
+            size_bytes INTEGER NOT NULL DEFAULT 0,
+            created_ts INTEGER NOT NULL,
+            is_locked INTEGER NOT NULL DEFAULT 0,
+            UNIQUE(username, filename)
+        );
+        INSERT INTO files_new
+            (id, username, filename, folder_id, size_bytes, created_ts, is_locked)
+        SELECT id, username, filename, folder_id, size_bytes,
+               iso_to_ts(created_at), is_locked
+        FROM files;
+        DROP TABLE files;
+        ALTER TABLE files_new RENAME TO files;
+        COMMIT;
+    """)
+
+
 # ------------------------------------------------------------------
 # Initialization
 # ------------------------------------------------------------------
@@ -144,6 +212,7 @@ async def init_db() -> None:
     logger.info("notes.db initialized.")
 
     files_db = await get_files_db()
+    await _migrate_files_created_ts(files_db)
     await files_db.executescript(FILES_DB_SCHEMA)
     await files_db.commit()
     logger.info("files.db initialized.")
@@ -3,7 +3,7 @@ import os
 import hashlib
 import asyncio
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 from backend.config import settings
 
 class DedupService:
@@ -41,10 +41,26 @@ class DedupService:
                 sha256_hash.update(byte_block)
         return sha256_hash.hexdigest()
 
-    async def deduplicate(self, file_path: Path) -> bool:
+    @staticmethod
+    def _is_unchanged(file_path: Path, identity: Optional[Tuple[int, int, int]]) -> bool:
+        """Check that file_path still holds the file identified by (st_dev, st_ino, st_size)."""
+        if identity is None:
+            return True
+        try:
+            st = os.stat(file_path)
+        except FileNotFoundError:
+            return False
+        return (st.st_dev, st.st_ino, st.st_size) == identity
+
+    async def deduplicate(
+        self, file_path: Path, identity: Optional[Tuple[int, int, int]] = None
+    ) -> bool:
         """
         Check if file is a duplicate. If so, replace with hardlink.
         If not, index it.
+        If identity (st_dev, st_ino, st_size) is given and the path no longer
+        holds that file (deleted, renamed, or replaced by a new upload while
+        hashing), nothing is indexed or replaced.
         Returns True if deduplicated (space saved), False otherwise.
         """
         try:
@@ -52,6 +68,9 @@ class DedupService:
             # Offload to thread to avoid blocking event loop
             loop = asyncio.get_event_loop()
             file_hash = await loop.run_in_executor(None, self.calculate_hash, file_path)
+            # The hash may belong to a file that has since been swapped out
+            if not self._is_unchanged(file_path, identity):
+                return False
 
             # 2. Check Index
             existing_path_str = self._hash_map.get(file_hash)
@@ -66,7 +85,10 @@ class DedupService:
                         return True
 
                     # 3. Deduplicate!
-                    # Remove the new file and replace with hardlink to existing
+                    # Remove the new file and replace with hardlink to existing;
+                    # re-check right before so a different file is never replaced
+                    if not self._is_unchanged(file_path, identity):
+                        return False
                     print(f"Deduplicating {file_path.name} -> {existing_path.name}")
                     os.remove(file_path)
                     os.link(existing_path, file_path)
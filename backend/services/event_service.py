@@ -1,66 +1,157 @@
-from typing import Dict, List
+import asyncio
+from typing import Callable, Dict, Set
 from fastapi import WebSocket
 
+# Max seconds to wait on a single client before treating it as dead
+SEND_TIMEOUT = 2.0
+# Pending messages allowed per connection before it is considered stalled
+QUEUE_SIZE = 16
+# Close code sent to dropped clients ("try again later"); they reconnect on close
+DROP_CLOSE_CODE = 1013
+
 class EventService:
-    """Service for managing WebSocket connections and broadcasting updates."""
+    """Service for managing WebSocket connections and broadcasting updates.
+
+    Each connection owns a small outbound queue drained by its own sender
+    task, so a broadcast is just N non-blocking puts and a slow client can
+    only ever hold QUEUE_SIZE messages before it is dropped. Messages are
+    signals to re-fetch, so one already waiting in a queue is not queued
+    again; bursts of notifications collapse instead of filling the queue.
+    """
 
     def __init__(self):
-        # dictionary mapping username -> list of active websockets
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        # dictionary mapping username -> set of active websockets
+        self.active_connections: Dict[str, Set[WebSocket]] = {}
         # global connections for system-wide events
-        self.global_connections: List[WebSocket] = []
+        self.global_connections: Set[WebSocket] = set()
+        # per-connection outbound queue and the task draining it
+        self._queues: Dict[WebSocket, asyncio.Queue] = {}
+        # messages currently waiting in each connection's queue
+        self._queued: Dict[WebSocket, Set[str]] = {}
+        self._senders: Dict[WebSocket, asyncio.Task] = {}
+        # close() calls in progress for dropped connections
+        self._closing: Set[asyncio.Task] = set()
+
+    # --- Per-connection delivery ---
+
+    def _start_sender(self, websocket: WebSocket, untrack: Callable[[], None]):
+        """Create the outbound queue and sender task for a connection."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        queued: Set[str] = set()
+        self._queues[websocket] = queue
+        self._queued[websocket] = queued
+        self._senders[websocket] = asyncio.create_task(
+            self._sender(websocket, queue, queued, untrack)
+        )
+
+    async def _sender(
+        self,
+        websocket: WebSocket,
+        queue: asyncio.Queue,
+        queued: Set[str],
+        untrack: Callable[[], None],
+    ):
+        """Drain a connection's queue; drop the connection on failure or timeout."""
+        while True:
+            message = await queue.get()
+            # A new copy may be queued again once this one is on its way
+            queued.discard(message)
+            try:
+                await asyncio.wait_for(websocket.send_text(message), timeout=SEND_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._drop(websocket, untrack)
+                return
+
+    def _stop_sender(self, websocket: WebSocket):
+        """Discard a connection's queue and cancel its sender task."""
+        self._queues.pop(websocket, None)
+        self._queued.pop(websocket, None)
+        task = self._senders.pop(websocket, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+    def _drop(self, websocket: WebSocket, untrack: Callable[[], None]):
+        """Untrack a dead or stalled connection and close its socket.
+
+        Closing matters: the endpoint's receive loop would otherwise keep
+        the socket open, leaving a client that looks connected but never
+        hears from us again. On close it reconnects and re-fetches.
+        """
+        untrack()
+        task = asyncio.create_task(self._close(websocket))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, websocket: WebSocket):
+        """Close a dropped socket, giving up after SEND_TIMEOUT."""
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=DROP_CLOSE_CODE), timeout=SEND_TIMEOUT
+            )
+        except Exception:
+            pass  # Already closed or unreachable
+
+    def _enqueue(self, websocket: WebSocket, message: str) -> bool:
+        """Queue a message without waiting. Returns False if the client is stalled."""
+        queue = self._queues.get(websocket)
+        if queue is None:
+            return False
+        queued = self._queued[websocket]
+        if message in queued:
+            return True  # Coalesced with the copy already waiting
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            return False
+        queued.add(message)
+        return True
+
+    # --- User Events ---
 
     async def connect(self, username: str, websocket: WebSocket):
         """Accept a connection and track it for a specific user."""
         await websocket.accept()
-        if username not in self.active_connections:
-            self.active_connections[username] = []
-        self.active_connections[username].append(websocket)
+        self.active_connections.setdefault(username, set()).add(websocket)
+        self._start_sender(websocket, lambda: self.disconnect(username, websocket))
 
     def disconnect(self, username: str, websocket: WebSocket):
         """Remove a tracking connection."""
-        if username in self.active_connections:
-            if websocket in self.active_connections[username]:
-                self.active_connections[username].remove(websocket)
-            if not self.active_connections[username]:
+        connections = self.active_connections.get(username)
+        if connections is not None:
+            connections.discard(websocket)
+            if not connections:
                 del self.active_connections[username]
+        self._stop_sender(websocket)
 
     async def notify_user_update(self, username: str):
         """Broadcast an update signal to all active sessions of a user."""
-        if username in self.active_connections:
-            # We send a "ping" or "refresh" message
-            # The client should treat any message as a signal to re-fetch data
-            dead_connections = []
-            for connection in self.active_connections[username]:
-                try:
-                    await connection.send_text("REFRESH")
-                except Exception:
-                    dead_connections.append(connection)
-            
-            # Cleanup dead connections
-            for dead in dead_connections:
-                self.disconnect(username, dead)
+        # We send a "ping" or "refresh" message
+        # The client should treat any message as a signal to re-fetch data
+        for connection in tuple(self.active_connections.get(username, ())):
+            if not self._enqueue(connection, "REFRESH"):
+                self._drop(
+                    connection, lambda c=connection: self.disconnect(username, c)
+                )
 
     # --- Global Events ---
-    
+
     async def connect_global(self, websocket: WebSocket):
         """Accept and track a global listener."""
         await websocket.accept()
-        self.global_connections.append(websocket)
+        self.global_connections.add(websocket)
+        self._start_sender(websocket, lambda: self.disconnect_global(websocket))
 
     def disconnect_global(self, websocket: WebSocket):
         """Remove a global listener."""
-        if websocket in self.global_connections:
-            self.global_connections.remove(websocket)
+        self.global_connections.discard(websocket)
+        self._stop_sender(websocket)
 
     async def notify_global_update(self, message: str):
         """Broadcast a message to all global listeners."""
-        dead_connections = []
-        for connection in self.global_connections:
-            try:
-                await connection.send_text(message)
-            except Exception:
-                dead_connections.append(connection)
-        
+        for connection in tuple(self.global_connections):
+            if not self._enqueue(connection, message):
+                self._drop(connection, lambda c=connection: self.disconnect_global(c))
 
 event_service = EventService()
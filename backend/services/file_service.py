@@ -7,21 +7,53 @@ Reconciliation on startup syncs disk ↔ DB.
 """
 
 import asyncio
+import errno
+import logging
 import os
+import re
+import shutil
+import sqlite3
 import tempfile
+import time
 import zipfile
-from datetime import datetime, timedelta
+from datetime import datetime
+from operator import itemgetter
 from pathlib import Path
-from typing import List, Optional, Set
-
-import aiofiles.os
-import logging
+from typing import List, Optional, Set, Tuple
 
 from backend.config import settings
 from backend.services.database import get_files_db
+from backend.services.dedup_service import dedup_service
 
 logger = logging.getLogger(__name__)
 
+# Already-compressed formats: deflating them again burns CPU for no gain.
+STORED_EXTENSIONS = frozenset({
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".heif",
+    ".mp4", ".mov", ".mkv", ".webm", ".avi", ".mp3", ".aac", ".flac",
+    ".zip", ".gz", ".7z", ".rar", ".bz2", ".xz",
+})
+
+# Copy buffer for entries stored without compression in zip downloads
+ZIP_COPY_BUFSIZE = 1024 * 1024
+
+# Strong references to fire-and-forget tasks (e.g. post-upload dedup)
+_background_tasks: Set[asyncio.Task] = set()
+
+# Bound on remembered directories; the cache is simply reset when full.
+KNOWN_DIRS_LIMIT = 10000
+
+
+def _escape_like(value: str) -> str:
+    """Escape LIKE wildcards so a literal string can be used in a pattern."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _zip_compress_type(filename: str) -> int:
+    """Pick the zip compression method for a file based on its extension."""
+    ext = os.path.splitext(filename)[1].lower()
+    return zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
 
 class FileService:
     """Service for file-related operations backed by files.db."""
@@ -33,11 +65,49 @@ class FileService:
             upload_base: The base directory for uploads.
         """
         self.upload_base = upload_base
+        # Directories already known to exist, so mkdir is skipped on reuse
+        self._known_dirs: Set[str] = set()
 
     # ------------------------------------------------------------------
     # Path helpers
     # ------------------------------------------------------------------
 
+    def _ensure_dir(self, path: Path) -> None:
+        """Create ``path`` unless it was already created by this service.
+
+        Args:
+            path: The directory to ensure.
+        """
+        key = str(path)
+        if key in self._known_dirs:
+            return
+        path.mkdir(parents=True, exist_ok=True)
+        if len(self._known_dirs) >= KNOWN_DIRS_LIMIT:
+            self._known_dirs.clear()
+        # mkdir(parents=True) created every ancestor too; remember them so
+        # e.g. the user base folder is a hit after any subfolder access.
+        self._known_dirs.add(key)
+        for parent in path.parents:
+            if parent == self.upload_base:
+                break
+            self._known_dirs.add(str(parent))
+
+    def invalidate_dir_cache(self, path: Path) -> None:
+        """Forget cached directories at or below ``path``.
+
+        Must be called after a directory is removed or moved so the next
+        access recreates it instead of trusting the stale cache entry.
+
+        Args:
+            path: The directory that was removed or moved.
+        """
+        prefix = str(path)
+        nested = prefix + os.sep
+        self._known_dirs = {
+            d for d in self._known_dirs
+            if d != prefix and not d.startswith(nested)
+        }
+
     def _get_user_base_folder(self, username: str) -> Path:
         """Get the absolute path to a user's root upload folder.
 
@@ -48,7 +118,7 @@ class FileService:
             The Path object for the base folder.
         """
         path = self.upload_base / username
-        path.mkdir(parents=True, exist_ok=True)
+        self._ensure_dir(path)
         return path
 
     def _get_folder_path(
@@ -66,7 +136,7 @@ class FileService:
         path = self._get_user_base_folder(username)
         for name in folder_path_names:
             path = path / name
-        path.mkdir(parents=True, exist_ok=True)
+        self._ensure_dir(path)
         return path
 
     # ------------------------------------------------------------------
@@ -85,6 +155,8 @@ class FileService:
         Args:
             username: The username (folder field value).
             retention_days: Optional custom retention period.
+            excluded_folder_ids: Optional set of folder IDs to skip.
+            include_locked: Whether locked files are returned.
 
         Returns:
             A list of file info dicts.
@@ -92,26 +164,30 @@ class FileService:
         if retention_days is None:
             retention_days = settings.logic.file_retention_days
 
+        now_ts = int(time.time())
+        retention_secs = retention_days * 86400
+
+        # Timestamp formatting and expiry arithmetic run inside SQLite (on
+        # aiosqlite's worker thread) rather than per row on the event loop.
         db = await get_files_db()
         cursor = await db.execute(
-            "SELECT * FROM files WHERE username = ? ORDER BY filename",
-            (username,),
+            "SELECT filename, size_bytes, folder_id, is_locked, "
+            "strftime('%Y-%m-%d %H:%M:%S', created_ts, 'unixepoch', 'localtime'), "
+            "created_ts + ? - ? "
+            "FROM files WHERE username = ? ORDER BY filename",
+            (retention_secs, now_ts, username),
         )
         rows = await cursor.fetchall()
 
         files = []
-        for row in rows:
-            r = dict(row)
+        for filename, size_bytes, folder_id, is_locked, created, remaining in rows:
             # Skip if file is in an excluded folder
-            if excluded_folder_ids and r["folder_id"] in excluded_folder_ids:
+            if excluded_folder_ids and folder_id in excluded_folder_ids:
                 continue
                 
             # Skip if file is locked and we don't include locked
-            if not include_locked and r["is_locked"]:
+            if not include_locked and is_locked:
                 continue
-                
-            created_time = datetime.fromisoformat(r["created_at"])
-            size_bytes = r["size_bytes"]
 
             if retention_days == 0:
                 remaining_days = -1
@@ -119,24 +195,23 @@ class FileService:
                 remaining_minutes = 0
                 expired = False
             else:
-                expiry_time = created_time + timedelta(days=retention_days)
-                remaining = expiry_time - datetime.now()
-                remaining_days = max(0, remaining.days)
-                remaining_hours = max(0, remaining.seconds // 3600)
-                remaining_minutes = max(0, (remaining.seconds % 3600) // 60)
-                expired = remaining.total_seconds() <= 0
+                expired = remaining <= 0
+                days, seconds = divmod(remaining, 86400)
+                remaining_days = max(0, days)
+                remaining_hours = seconds // 3600
+                remaining_minutes = (seconds % 3600) // 60
 
             files.append({
-                "name": r["filename"],
+                "name": filename,
                 "size": round(size_bytes / (1024 * 1024), 2),
                 "size_bytes": size_bytes,
-                "created": created_time.strftime("%Y-%m-%d %H:%M:%S"),
+                "created": created,
                 "remaining_days": remaining_days,
                 "remaining_hours": remaining_hours,
                 "remaining_minutes": remaining_minutes,
                 "expired": expired,
-                "is_locked": bool(r["is_locked"]),
-                "folder_id": r["folder_id"],
+                "is_locked": bool(is_locked),
+                "folder_id": folder_id,
             })
 
         return files
@@ -165,9 +240,9 @@ class FileService:
         db = await get_files_db()
         await db.execute(
             "INSERT INTO files (username, filename, folder_id, size_bytes, "
-            "created_at, is_locked) VALUES (?, ?, ?, ?, ?, 0)",
+            "created_ts, is_locked) VALUES (?, ?, ?, ?, ?, 0)",
             (username, filename, folder_id, size_bytes,
-             created_at.isoformat()),
+             int(created_at.timestamp())),
         )
         await db.commit()
 
@@ -185,10 +260,143 @@ class FileService:
         )
         await db.commit()
 
+    async def _allocate_unique_name(
+        self,
+        username: str,
+        folder: Path,
+        filename: str,
+        current_name: Optional[str] = None,
+    ) -> str:
+        """Pick a free filename, appending ``_N`` before the extension.
+
+        Existing ``name_N.ext`` variants are fetched with one query plus one
+        directory listing, and the counter jumps straight past the highest
+        suffix in use.  The DB key
+        is unique per user, so names in other folders count as taken too.
+
+        Args:
+            username: The username.
+            folder: Target physical folder.
+            filename: The desired filename.
+            current_name: Name of the file being moved, which does not
+                collide with itself.
+
+        Returns:
+            A filename free both in the DB index and in the folder on disk.
+        """
+        db = await get_files_db()
+
+        # Fast path: a point lookup on the unique index settles the common
+        # no-collision case without scanning for suffixed variants.
+        in_db = False
+        if filename != current_name:
+            cursor = await db.execute(
+                "SELECT EXISTS(SELECT 1 FROM files "
+                "WHERE username = ? AND filename = ?)",
+                (username, filename),
+            )
+            (in_db,) = await cursor.fetchone()
+        if not in_db and not (folder / filename).exists():
+            return filename
+
+        name, ext = os.path.splitext(filename)
+        like = _escape_like(name) + "\\_%" + _escape_like(ext)
+        cursor = await db.execute(
+            "SELECT filename FROM files WHERE username = ? "
+            "AND (filename = ? OR filename LIKE ? ESCAPE '\\')",
+            (username, filename, like),
+        )
+        taken = {row["filename"] for row in await cursor.fetchall()}
+        # Files not yet reconciled into the DB may still occupy a name, so
+        # fold in one directory listing instead of probing name by name.
+        loop = asyncio.get_event_loop()
+        taken |= await loop.run_in_executor(None, self._list_dir_names_sync, folder)
+        taken.discard(current_name)
+
+        pattern = re.compile(rf"^{re.escape(name)}_(\d+){re.escape(ext)}$")
+        suffixes = (pattern.match(t) for t in taken)
+        counter = max((int(m.group(1)) for m in suffixes if m), default=0) + 1
+        # Above every suffix in use, so free in the DB and on disk alike
+        return f"{name}_{counter}{ext}"
+
+    @staticmethod
+    def _list_dir_names_sync(folder: Path) -> Set[str]:
+        """Return the entry names in ``folder`` from a single scandir pass.
+
+        Args:
+            folder: Directory to list.
+
+        Returns:
+            Set of entry names; empty if the folder cannot be read.
+        """
+        try:
+            with os.scandir(folder) as it:
+                return {entry.name for entry in it}
+        except OSError:
+            return set()
+
+    # ------------------------------------------------------------------
+    # Background deduplication
+    # ------------------------------------------------------------------
+
+    def _schedule_dedup(self, path: Path, stat: os.stat_result) -> None:
+        """Hash and deduplicate ``path`` in a background task.
+
+        Args:
+            path: The newly stored file.
+            stat: Its stat result, so dedup can tell if the path has been
+                replaced by another file before it gets to swap it.
+        """
+        identity = (stat.st_dev, stat.st_ino, stat.st_size)
+        task = asyncio.create_task(self._safe_dedup(path, identity))
+        # The loop only keeps weak references; hold tasks until they finish
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+    @staticmethod
+    async def _safe_dedup(path: Path, identity: Tuple[int, int, int]) -> None:
+        """Run deduplication, logging instead of raising on failure."""
+        try:
+            await dedup_service.deduplicate(path, identity)
+        except Exception as e:
+            logger.warning(f"Dedup failed for {path.name}: {e}")
+
     # ------------------------------------------------------------------
     # File operations (disk + DB)
     # ------------------------------------------------------------------
 
+    @staticmethod
+    def _write_new_file_sync(path: Path, data: bytes) -> os.stat_result:
+        """Create ``path`` exclusively and write ``data`` in one go.
+
+        Extents are preallocated where the platform supports it to limit
+        fragmentation of large uploads.
+
+        Args:
+            path: Destination path; must not already exist.
+            data: The file content.
+
+        Returns:
+            The stat result of the written file.
+
+        Raises:
+            FileExistsError: If ``path`` already exists.
+        """
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            if data and hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(fd, 0, len(data))
+                except OSError:
+                    pass  # Filesystem does not support preallocation
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+            return os.fstat(fd)
+        finally:
+            os.close(fd)
+
     async def save_file(
         self,
         username: str,
@@ -211,31 +419,28 @@ class FileService:
         """
         filename = os.path.basename(filename)
         folder = self._get_folder_path(username, folder_path_names or [])
-        name, ext = os.path.splitext(filename)
-        counter = 1
-        unique_name = filename
-
-        while (folder / unique_name).exists():
-            unique_name = f"{name}_{counter}{ext}"
-            counter += 1
+        unique_name = await self._allocate_unique_name(username, folder, filename)
 
-        async with aiofiles.open(folder / unique_name, mode="wb") as f:
-            await f.write(content)
-
-        stat = (folder / unique_name).stat()
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                stat = await loop.run_in_executor(
+                    None, self._write_new_file_sync, folder / unique_name, content
+                )
+                break
+            except FileExistsError:
+                # Lost a race with a concurrent upload of the same name
+                unique_name = await self._allocate_unique_name(
+                    username, folder, filename
+                )
 
-        # Register in DB
+        # Size is already known from the buffer; no need to stat what we just wrote
         await self._register_file(
-            username, unique_name, stat.st_size,
-            datetime.fromtimestamp(stat.st_mtime), folder_id,
+            username, unique_name, len(content), datetime.now(), folder_id,
         )
 
-        # Trigger deduplication
-        from backend.services.dedup_service import dedup_service
-        try:
-            await dedup_service.deduplicate(folder / unique_name)
-        except Exception as e:
-            logger.warning(f"Dedup failed: {e}")
+        # Trigger deduplication without holding up the response
+        self._schedule_dedup(folder / unique_name, stat)
 
         return unique_name
 
@@ -258,13 +463,21 @@ class FileService:
         filename = os.path.basename(filename)
         folder = self._get_folder_path(username, folder_path_names or [])
         filepath = folder / filename
-        if filepath.exists() and filepath.is_file():
-            await aiofiles.os.remove(filepath)
+        # unlink is a microsecond metadata op on local disks; call it
+        # directly and let the error replace separate exists/is_file probes.
+        try:
+            os.unlink(filepath)
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError,
+                PermissionError) as e:
+            # macOS and Windows report unlinking a directory as
+            # PermissionError; a genuine permission problem still raises.
+            if isinstance(e, PermissionError) and not filepath.is_dir():
+                raise
+            # Even if file not on disk, try removing stale DB record
             await self._deregister_file(username, filename)
-            return True
-        # Even if file not on disk, try removing stale DB record
+            return False
         await self._deregister_file(username, filename)
-        return False
+        return True
 
     async def rename_file(
         self,
@@ -291,19 +504,35 @@ class FileService:
         old_path = folder / old_name
         new_path = folder / new_name
 
-        if not old_path.exists() or not old_path.is_file():
+        # The UNIQUE(username, filename) index decides name collisions
+        db = await get_files_db()
+        try:
+            cursor = await db.execute(
+                "UPDATE files SET filename = ? WHERE username = ? AND filename = ?",
+                (new_name, username, old_name),
+            )
+        except sqlite3.IntegrityError:
+            # The failed statement is already undone; a rollback here would
+            # discard other coroutines' pending writes on the shared connection
             return False
-        if new_path.exists():
+        if cursor.rowcount == 0:
             return False
 
-        await aiofiles.os.rename(old_path, new_path)
+        try:
+            # Never clobber an untracked file that happens to sit on disk
+            if new_path.exists():
+                raise FileExistsError(new_path)
+            os.rename(old_path, new_path)
+        except OSError:
+            # Revert explicitly: the connection is shared, so a concurrent
+            # commit may already have flushed the UPDATE above.
+            await db.execute(
+                "UPDATE files SET filename = ? WHERE username = ? AND filename = ?",
+                (old_name, username, new_name),
+            )
+            await db.commit()
+            return False
 
-        # Update DB
-        db = await get_files_db()
-        await db.execute(
-            "UPDATE files SET filename = ? WHERE username = ? AND filename = ?",
-            (new_name, username, old_name),
-        )
         await db.commit()
         return True
 
@@ -335,14 +564,11 @@ class FileService:
             return False
 
         # Ensure name uniqueness in target
-        name, ext = os.path.splitext(filename)
-        target_name = filename
-        counter = 1
-        while (new_folder / target_name).exists():
-            target_name = f"{name}_{counter}{ext}"
-            counter += 1
+        target_name = await self._allocate_unique_name(
+            username, new_folder, filename, current_name=filename
+        )
 
-        await aiofiles.os.rename(old_folder / filename, new_folder / target_name)
+        os.rename(old_folder / filename, new_folder / target_name)
 
         # Update DB
         db = await get_files_db()
@@ -361,6 +587,39 @@ class FileService:
         await db.commit()
         return True
 
+    @staticmethod
+    def _move_into_place_sync(source: Path, target: Path) -> os.stat_result:
+        """Claim ``target``, rename ``source`` onto it and stat the result.
+
+        ``target`` is first created with ``O_EXCL`` so that two imports that
+        picked the same name cannot overwrite each other.  A rename is a metadata-only operation; when the two paths are on
+        different filesystems it falls back to ``shutil.move``, whose copy
+        uses in-kernel ``sendfile`` where the platform provides it.
+
+        Args:
+            source: The file to move.
+            target: Its new location.
+
+        Returns:
+            The stat result of the moved file.
+
+        Raises:
+            FileExistsError: If ``target`` already exists.
+        """
+        os.close(os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+        try:
+            try:
+                os.replace(source, target)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(source, target)
+        except BaseException:
+            # Give the claimed name back
+            target.unlink(missing_ok=True)
+            raise
+        return os.stat(target)
+
     async def import_file(
         self,
         source_path: Path,
@@ -387,31 +646,30 @@ class FileService:
         if not source_path.exists():
             return None
 
-        name, ext = os.path.splitext(filename)
-        counter = 1
-        unique_name = filename
-
-        while (folder / unique_name).exists():
-            unique_name = f"{name}_{counter}{ext}"
-            counter += 1
-
-        target_path = folder / unique_name
+        unique_name = await self._allocate_unique_name(username, folder, filename)
 
         try:
-            await aiofiles.os.rename(source_path, target_path)
-            stat = target_path.stat()
+            loop = asyncio.get_event_loop()
+            while True:
+                target_path = folder / unique_name
+                try:
+                    stat = await loop.run_in_executor(
+                        None, self._move_into_place_sync, source_path, target_path
+                    )
+                    break
+                except FileExistsError:
+                    # Lost a race with a concurrent import of the same name
+                    unique_name = await self._allocate_unique_name(
+                        username, folder, filename
+                    )
 
             await self._register_file(
                 username, unique_name, stat.st_size,
                 datetime.fromtimestamp(stat.st_mtime), folder_id,
             )
 
-            # Trigger deduplication
-            from backend.services.dedup_service import dedup_service
-            try:
-                await dedup_service.deduplicate(target_path)
-            except Exception as e:
-                logger.warning(f"Dedup failed for imported file {unique_name}: {e}")
+            # Trigger deduplication without holding up the response
+            self._schedule_dedup(target_path, stat)
 
             return unique_name
         except Exception as e:
@@ -455,7 +713,8 @@ class FileService:
         """
         db = await get_files_db()
         cursor = await db.execute(
-            "SELECT is_locked FROM files WHERE username = ? AND filename = ?",
+            "SELECT is_locked FROM files WHERE username = ? AND filename = ? "
+            "LIMIT 1",
             (username, filename),
         )
         row = await cursor.fetchone()
@@ -474,7 +733,8 @@ class FileService:
         new_path = base / new_name
 
         if old_path.exists() and old_path.is_dir() and not new_path.exists():
-            await aiofiles.os.rename(old_path, new_path)
+            os.rename(old_path, new_path)
+            self.invalidate_dir_cache(old_path)
             return True
         return False
 
@@ -484,17 +744,42 @@ class FileService:
         """Delete a physical directory recursively."""
         target_path = self._get_folder_path(username, path)
         if target_path.exists() and target_path.is_dir():
-            import shutil
             loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, shutil.rmtree, target_path)
+            await loop.run_in_executor(None, self._rmtree_sync, str(target_path))
+            self.invalidate_dir_cache(target_path)
             return True
         return False
 
+    @staticmethod
+    def _rmtree_sync(root: str) -> None:
+        """Delete a directory tree using one scandir pass per directory.
+
+        Unlike ``shutil.rmtree`` there is no per-entry lstat/fd bookkeeping:
+        DirEntry type info decides between unlink and descend, and symlinks
+        are unlinked, never followed.
+
+        Args:
+            root: Directory to remove.
+        """
+        dirs = [root]  # Parents always precede their children
+        stack = [root]
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                entries = list(it)
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    dirs.append(entry.path)
+                else:
+                    os.unlink(entry.path)
+        for path in reversed(dirs):
+            os.rmdir(path)
+
     # ------------------------------------------------------------------
     # Batch operations
     # ------------------------------------------------------------------
 
-    def create_batch_zip(
+    async def create_batch_zip(
         self,
         username: str,
         filenames: List[str],
@@ -511,17 +796,60 @@ class FileService:
             Path to the created temporary zip file.
         """
         user_folder = self._get_folder_path(username, folder_path_names or [])
+        entries = []
+        for filename in filenames:
+            filename = os.path.basename(filename)
+            entries.append((user_folder / filename, filename))
+        return await self.create_zip(entries)
+
+    async def create_zip(self, entries: List[Tuple[Path, str]]) -> Path:
+        """Write files into a temporary zip archive off the event loop.
+
+        Already-compressed media is stored as-is; everything else is
+        deflated at level 1, which is far cheaper than the default and
+        loses little on typical documents.
 
+        Args:
+            entries: ``(source path, archive name)`` pairs.  Missing
+                sources are skipped.
+
+        Returns:
+            Path to the created temporary zip file.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._create_zip_sync, entries)
+
+    @staticmethod
+    def _create_zip_sync(entries: List[Tuple[Path, str]]) -> Path:
+        """Synchronously write the zip archive.
+
+        Args:
+            entries: ``(source path, archive name)`` pairs.
+
+        Returns:
+            Path to the created temporary zip file.
+        """
         temp_zip = tempfile.NamedTemporaryFile(suffix=".zip", delete=False)
         temp_zip_path = Path(temp_zip.name)
         temp_zip.close()
 
-        with zipfile.ZipFile(temp_zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            for filename in filenames:
-                filename = os.path.basename(filename)
-                filepath = user_folder / filename
-                if filepath.exists() and filepath.is_file():
-                    zf.write(filepath, arcname=filename)
+        with zipfile.ZipFile(
+            temp_zip_path, "w", zipfile.ZIP_DEFLATED,
+            allowZip64=True, compresslevel=1,
+        ) as zf:
+            for filepath, arcname in entries:
+                if not filepath.is_file():
+                    continue
+                compress_type = _zip_compress_type(arcname)
+                if compress_type == zipfile.ZIP_STORED:
+                    # Stored entries are a straight copy; ZipFile.write
+                    # would move them through 8 KiB reads and writes.
+                    zinfo = zipfile.ZipInfo.from_file(filepath, arcname)
+                    zinfo.compress_type = compress_type
+                    with open(filepath, "rb") as src, zf.open(zinfo, "w") as dest:
+                        shutil.copyfileobj(src, dest, ZIP_COPY_BUFSIZE)
+                else:
+                    zf.write(filepath, arcname=arcname, compress_type=compress_type)
 
         return temp_zip_path
 
@@ -553,47 +881,73 @@ class FileService:
             ]
         )
 
+        # Every directory listing across all users shares one bound, so slow
+        # (e.g. network-mounted) storage overlaps per-entry latency without
+        # flooding the thread pool.
+        sem = asyncio.Semaphore(settings.logic.stat_concurrency)
+
+        async def scan_one(user_dir: Path):
+            return user_dir.name, await self._scan_disk_files(str(user_dir), sem)
+
+        results = await asyncio.gather(*(scan_one(d) for d in user_dirs))
+
         db = await get_files_db()
 
-        for user_dir in user_dirs:
-            username = user_dir.name
+        for username, disk_files in results:
             stats["users_scanned"] += 1
 
-            # Get all files on disk (recursively), using run_in_executor
-            disk_files = await loop.run_in_executor(
-                None, self._scan_disk_files_sync, user_dir
-            )
-
-            # Get all files in DB for this user
+            # Both sides sorted by filename so one linear merge pass finds
+            # the differences.  SQLite's BINARY collation orders UTF-8 the
+            # same way Python orders str.
             cursor = await db.execute(
-                "SELECT filename FROM files WHERE username = ?", (username,)
+                "SELECT filename FROM files WHERE username = ? "
+                "ORDER BY filename",
+                (username,),
             )
-            db_rows = await cursor.fetchall()
-            db_filenames = {r["filename"] for r in db_rows}
-
-            disk_filenames = {f["filename"] for f in disk_files}
+            db_sorted = [r[0] for r in await cursor.fetchall()]
+            # Stable sort keeps the first occurrence of a name first
+            disk_sorted = sorted(disk_files, key=itemgetter("filename"))
+
+            insert_rows = []
+            to_delete = []
+            i = j = 0
+            last_name = None
+            while i < len(disk_sorted):
+                f = disk_sorted[i]
+                name = f["filename"]
+                if name == last_name:
+                    # Same name in another subfolder: first occurrence wins
+                    i += 1
+                    continue
+                if j < len(db_sorted) and db_sorted[j] < name:
+                    to_delete.append(db_sorted[j])
+                    j += 1
+                    continue
+                if j < len(db_sorted) and db_sorted[j] == name:
+                    j += 1
+                else:
+                    insert_rows.append((
+                        username, name, f["size_bytes"], f["created_ts"],
+                    ))
+                last_name = name
+                i += 1
+            to_delete.extend(db_sorted[j:])
 
             # INSERT missing (on disk but not in DB)
-            to_insert = disk_filenames - db_filenames
-            for filename in to_insert:
-                info = next(f for f in disk_files if f["filename"] == filename)
-                await db.execute(
-                    "INSERT INTO files (username, filename, folder_id, "
-                    "size_bytes, created_at, is_locked) "
-                    "VALUES (?, ?, NULL, ?, ?, 0)",
-                    (username, filename, info["size_bytes"],
-                     info["created_at"]),
-                )
-                stats["inserted"] += 1
+            await db.executemany(
+                "INSERT INTO files (username, filename, folder_id, "
+                "size_bytes, created_ts, is_locked) "
+                "VALUES (?, ?, NULL, ?, ?, 0)",
+                insert_rows,
+            )
+            stats["inserted"] += len(insert_rows)
 
             # DELETE stale (in DB but not on disk)
-            to_delete = db_filenames - disk_filenames
-            for filename in to_delete:
-                await db.execute(
-                    "DELETE FROM files WHERE username = ? AND filename = ?",
-                    (username, filename),
-                )
-                stats["deleted"] += 1
+            await db.executemany(
+                "DELETE FROM files WHERE username = ? AND filename = ?",
+                [(username, filename) for filename in to_delete],
+            )
+            stats["deleted"] += len(to_delete)
 
         await db.commit()
         logger.info(
@@ -602,33 +956,67 @@ class FileService:
         )
         return stats
 
-    @staticmethod
-    def _scan_disk_files_sync(user_dir: Path) -> List[dict]:
-        """Synchronously scan a user's directory for files.
+    async def _scan_disk_files(
+        self, dir_path: str, sem: asyncio.Semaphore
+    ) -> List[dict]:
+        """Recursively scan a directory, listing subdirectories concurrently.
+
+        Results keep os.walk's top-down order (a directory's files before
+        its subdirectories), which decides which duplicate name wins.
 
         Args:
-            user_dir: The user's upload directory.
+            dir_path: Directory to scan.
+            sem: Bounds how many directories are listed at once.
 
         Returns:
-            List of dicts with filename, size_bytes, created_at.
+            List of dicts with filename, size_bytes, created_ts.
         """
-        files = []
-        for root, _dirs, filenames in os.walk(user_dir):
-            for filename in filenames:
-                item = Path(root) / filename
-                try:
-                    stat = item.stat()
-                    files.append({
-                        "filename": filename,
-                        "size_bytes": stat.st_size,
-                        "created_at": datetime.fromtimestamp(
-                            stat.st_mtime
-                        ).isoformat(),
-                    })
-                except OSError:
-                    continue
+        loop = asyncio.get_event_loop()
+        async with sem:
+            files, subdirs = await loop.run_in_executor(
+                None, self._scan_dir_sync, dir_path
+            )
+        if subdirs:
+            nested = await asyncio.gather(
+                *(self._scan_disk_files(d, sem) for d in subdirs)
+            )
+            for sub_files in nested:
+                files.extend(sub_files)
         return files
 
+    @staticmethod
+    def _scan_dir_sync(dir_path: str) -> Tuple[List[dict], List[str]]:
+        """Synchronously list one directory level.
+
+        Args:
+            dir_path: Directory to list.
+
+        Returns:
+            Tuple of (file dicts, subdirectory paths).
+        """
+        files: List[dict] = []
+        subdirs: List[str] = []
+        try:
+            with os.scandir(dir_path) as it:
+                entries = list(it)
+        except OSError:
+            return files, subdirs
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    # Like os.walk, do not descend into symlinked dirs
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append({
+                "filename": entry.name,
+                "size_bytes": stat.st_size,
+                "created_ts": int(stat.st_mtime),
+            })
+        return files, subdirs
 
 # Singleton instance
 file_service = FileService()
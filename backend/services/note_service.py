@@ -9,6 +9,15 @@ from typing import List, Optional, Set
 
 from backend.services.database import get_notes_db
 
+# Keep IN (...) lists under SQLite's historical 999 bound-parameter limit
+IN_CHUNK_SIZE = 900
+
+
+def _chunks(items: List[str], size: int = IN_CHUNK_SIZE):
+    """Yield consecutive slices of ``items`` of at most ``size`` elements."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
 
 class NoteService:
     """Service for note/URL operations backed by notes.db."""
@@ -145,10 +154,12 @@ class NoteService:
             return 0
         db = await get_notes_db()
         count = 0
-        for url in urls:
+        for chunk in _chunks(urls):
+            placeholders = ",".join("?" * len(chunk))
             cursor = await db.execute(
-                "DELETE FROM urls WHERE username = ? AND url = ? AND is_locked = 0",
-                (username, url),
+                "DELETE FROM urls WHERE username = ? AND is_locked = 0 "
+                f"AND url IN ({placeholders})",
+                (username, *chunk),
             )
             count += cursor.rowcount
         await db.commit()
@@ -171,10 +182,12 @@ class NoteService:
             return 0
         db = await get_notes_db()
         count = 0
-        for url in urls:
+        for chunk in _chunks(urls):
+            placeholders = ",".join("?" * len(chunk))
             cursor = await db.execute(
-                "UPDATE urls SET is_locked = ? WHERE username = ? AND url = ?",
-                (int(is_locked), username, url),
+                "UPDATE urls SET is_locked = ? WHERE username = ? "
+                f"AND url IN ({placeholders})",
+                (int(is_locked), username, *chunk),
             )
             count += cursor.rowcount
         await db.commit()
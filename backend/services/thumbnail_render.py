@@ -0,0 +1,59 @@
+"""
+Image thumbnail rendering, run inside thumbnail worker processes.
+
+Kept apart from thumbnail_service so that workers importing it don't also
+create the service singleton (cache directories, ffmpeg probe, warnings).
+"""
+
+import io
+import os
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+# libvips is optional: it shrinks on load and releases the GIL, but needs the
+# native library installed. Pillow is used whenever it is unavailable.
+try:
+    import pyvips
+except (ImportError, OSError):
+    pyvips = None
+
+
+def render_image(input_path: Path, output_path: Path, size, use_vips: bool):
+    """Decode, crop and encode one image thumbnail. Runs in a worker process."""
+    if use_vips:
+        try:
+            image = pyvips.Image.thumbnail(
+                str(input_path), size[0], height=size[1], crop='centre',
+            )
+            write_thumb(output_path, image.jpegsave_buffer(Q=80, strip=True))
+            return
+        except pyvips.Error:
+            pass  # Format libvips can't load; fall back to Pillow
+
+    with Image.open(input_path) as img:
+        if img.format == 'JPEG':
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale while staying at
+            # least 2x the target, instead of decoding every pixel.
+            img.draft('RGB', (size[0] * 2, size[1] * 2))
+
+        # Convert to RGB (handle RGBA, P, etc.)
+        if img.mode in ('RGBA', 'P'):
+            img = img.convert('RGB')
+
+        # Smart crop/resize
+        img = ImageOps.fit(img, size, method=Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=80)
+    write_thumb(output_path, buf.getbuffer())
+
+
+def write_thumb(output_path: Path, data) -> None:
+    """Write an encoded thumbnail with a single write instead of many small ones."""
+    view = memoryview(data)
+    fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
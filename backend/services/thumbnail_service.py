@@ -1,76 +1,157 @@
 
+import multiprocessing
 import os
-import hashlib
+import re
 import shutil
 import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from PIL import Image, ImageOps
+from typing import Optional, Set
 import asyncio
 from backend.config import settings
+from backend.services.thumbnail_render import pyvips, render_image
+
+# Bound on remembered cache files; the set is simply reset when full
+KNOWN_THUMBS_LIMIT = 16384
+
+# Video thumbnail requests arriving within this window share one ffmpeg run
+VIDEO_BATCH_WINDOW = 0.1
+VIDEO_BATCH_MAX = 16
+
+# Image decoding runs in worker processes so it scales past the GIL;
+# ffmpeg runs are capped at the same count to avoid a fork storm.
+THUMB_WORKERS = os.cpu_count() or 4
+
+# Header reads skip the atime update (an inode write) where supported
+_O_BINARY = getattr(os, 'O_BINARY', 0)
+_HEADER_OPEN_FLAGS = os.O_RDONLY | _O_BINARY | getattr(os, 'O_NOATIME', 0)
+
+# Magic-byte validation, keyed by lowercase extension. Each pattern is
+# anchored at the start of the 16-byte header, so one match() call does the
+# whole check in C.
+_JPEG = re.compile(rb'\xff\xd8\xff')
+# Most RAW formats use TIFF structure: II* (Little Endian) or MM (Big Endian)
+_TIFF = re.compile(rb'II\x2a\x00|MM\x00\x2a')
+_HEIF = re.compile(rb'(?=.*?ftyp)(?=.*?(?:heic|heix|hevc|mif1))', re.DOTALL)
+# ftyp usually starts at offset 4; EBML magic marks mkv/webm
+_VIDEO = re.compile(rb'\x1a\x45\xdf\xa3|.*?(?:ftyp|matroska|RIFF)', re.DOTALL)
+_MEDIA_SIGNATURES = {
+    '.jpg': _JPEG,
+    '.jpeg': _JPEG,
+    '.png': re.compile(rb'\x89PNG\r\n\x1a\n'),
+    '.gif': re.compile(rb'GIF8[79]a'),
+    '.bmp': re.compile(rb'BM'),
+    '.webp': re.compile(rb'RIFF.*?WEBP', re.DOTALL),
+    '.heic': _HEIF,
+    '.heif': _HEIF,
+    **{ext: _TIFF for ext in ('.arw', '.cr2', '.nef', '.dng', '.orf', '.sr2', '.raf')},
+    **{ext: _VIDEO for ext in ('.mp4', '.mov', '.avi', '.mkv', '.webm')},
+}
+
 
 class ThumbnailService:
     def __init__(self):
         self.cache_dir = settings.paths.tus_temp_folder.parent / "cache" / "thumbnails"
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.thumb_size = (300, 300)
+        # Cache files known to exist; entries are never deleted while running
+        self._known_thumbs: Set[str] = set()
         # Check if ffmpeg is available at startup
         self._ffmpeg_available = shutil.which("ffmpeg") is not None
-        if not self._ffmpeg_available:
+        if not self._ffmpeg_available and multiprocessing.current_process().name == "MainProcess":
+            # Workers re-import __main__ (and so this module) on start; warn once
             print("WARNING: ffmpeg not found. Video thumbnails will be unavailable.")
+        self._vips_available = pyvips is not None
+        # Pending video thumbnail requests and in-flight batch runs
+        self._video_batch = []
+        self._video_tasks: Set[asyncio.Task] = set()
+        # Created on first use so importing this module never spawns workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._ffmpeg_slots = asyncio.Semaphore(THUMB_WORKERS)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # forkserver avoids forking the whole server process; it is not
+            # available on Windows, where spawn is the default anyway.
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            context = multiprocessing.get_context(method)
+            if method == "forkserver":
+                # Preload only the render code instead of the default
+                # __main__, which would import the whole app into the server
+                context.set_forkserver_preload(["backend.services.thumbnail_render"])
+            self._executor = ProcessPoolExecutor(
+                max_workers=THUMB_WORKERS, mp_context=context,
+            )
+        return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor):
+        """Drop a broken pool so the next _get_executor() starts a fresh one.
+
+        Only the pool that actually broke is discarded: concurrent callers
+        failing on the same pool must not tear down its replacement.
+        """
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        """Stop the image worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
 
     def _is_valid_media(self, file_path: Path) -> bool:
         """Perform basic magic byte validation to ensure file is a legitimate media type."""
         try:
-            with open(file_path, "rb") as f:
-                header = f.read(16)
-                
-            ext = file_path.suffix.lower()
-            
-            # Image signatures
-            if ext in ['.jpg', '.jpeg']:
-                return header.startswith(b'\xff\xd8\xff')
-            if ext == '.png':
-                return header.startswith(b'\x89PNG\r\n\x1a\n')
-            if ext == '.gif':
-                return header.startswith(b'GIF87a') or header.startswith(b'GIF89a')
-            if ext == '.bmp':
-                return header.startswith(b'BM')
-            if ext == '.webp':
-                return header.startswith(b'RIFF') and b'WEBP' in header
-            if ext in ['.heic', '.heif']:
-                return b'ftyp' in header and (b'heic' in header or b'heix' in header or b'hevc' in header or b'mif1' in header)
-            if ext in ['.arw', '.cr2', '.nef', '.dng', '.orf', '.sr2', '.raf']:
-                # Most RAW formats use TIFF structure: II* (Little Endian) or MM (Big Endian)
-                return header.startswith(b'II\x2a\x00') or header.startswith(b'MM\x00\x2a')
-                
-            # Video signatures (simple ftyp check)
-            if ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm']:
-                # ftyp usually starts at offset 4
-                return b'ftyp' in header or b'matroska' in header or b'RIFF' in header or header.startswith(b'\x1a\x45\xdf\xa3') # EBML (mkv/webm)
-            
-            return False
-        except Exception:
+            try:
+                fd = os.open(file_path, _HEADER_OPEN_FLAGS)
+            except PermissionError:
+                # O_NOATIME is only permitted on files we own
+                fd = os.open(file_path, os.O_RDONLY | _O_BINARY)
+            try:
+                header = os.read(fd, 16)
+            finally:
+                os.close(fd)
+        except OSError:
             return False
 
-    def _get_cache_path(self, file_path: Path) -> Path:
-        """Generate a unique cache path based on file content hash (or path+mtime)"""
-        # Using path + mtime is faster than reading whole file for hash
-        stat = file_path.stat()
-        identifier = f"{file_path.absolute()}_{stat.st_mtime}_{stat.st_size}"
-        hash_name = hashlib.md5(identifier.encode()).hexdigest()
+        signature = _MEDIA_SIGNATURES.get(file_path.suffix.lower())
+        return signature is not None and signature.match(header) is not None
+
+    def _get_cache_path(self, file_path: Path, stat: Optional[os.stat_result] = None) -> Path:
+        """Generate a unique cache path from the file's identity (device+inode+mtime+size)"""
+        # The stat fields already identify this exact file version, so they
+        # are used as the name directly instead of hashing them.
+        if stat is None:
+            stat = file_path.stat()
+        key = f"{stat.st_dev:x}_{stat.st_ino:x}_{stat.st_mtime_ns:x}_{stat.st_size:x}"
         
         # Use .gif for gif files, .jpg for others
         ext = ".gif" if file_path.suffix.lower() == ".gif" else ".jpg"
-        return self.cache_dir / f"{hash_name}{ext}"
+        return self.cache_dir / f"{key}{ext}"
+
+    def _remember_thumb(self, cache_key: str):
+        """Record a cache file as present so later hits skip the exists() check."""
+        if len(self._known_thumbs) >= KNOWN_THUMBS_LIMIT:
+            self._known_thumbs.clear()
+        self._known_thumbs.add(cache_key)
 
     async def get_thumbnail(self, file_path: Path) -> str:
         """Get path to thumbnail, generating if necessary."""
-        if not file_path.exists():
+        # One stat both checks existence and keys the cache
+        try:
+            stat = file_path.stat()
+        except OSError:
             return None
 
-        cache_path = self._get_cache_path(file_path)
+        cache_path = self._get_cache_path(file_path, stat)
+        cache_key = str(cache_path)
+        if cache_key in self._known_thumbs:
+            return cache_key
         if cache_path.exists():
-            return str(cache_path)
+            self._remember_thumb(cache_key)
+            return cache_key
 
         # SECURITY: Validate file content before processing
         if not self._is_valid_media(file_path):
@@ -93,25 +174,26 @@ class ThumbnailService:
         else:
             return None  # No thumbnail for other types
 
-        return str(cache_path) if cache_path.exists() else None
+        if cache_path.exists():
+            self._remember_thumb(cache_key)
+            return cache_key
+        return None
 
     async def _generate_image_thumbnail(self, input_path: Path, output_path: Path):
+        args = (input_path, output_path, self.thumb_size, self._vips_available)
         try:
             loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, self._process_image, input_path, output_path)
+            executor = self._get_executor()
+            try:
+                await loop.run_in_executor(executor, render_image, *args)
+            except BrokenProcessPool:
+                # A worker died (OOM, native crash in a decoder); replace the
+                # pool and retry once so one bad file can't disable thumbnails
+                self._discard_executor(executor)
+                await loop.run_in_executor(self._get_executor(), render_image, *args)
         except Exception as e:
             print(f"Error generating image thumbnail for {input_path}: {e}")
 
-    def _process_image(self, input_path, output_path):
-        with Image.open(input_path) as img:
-            # Convert to RGB (handle RGBA, P, etc.)
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            
-            # Smart crop/resize
-            img = ImageOps.fit(img, self.thumb_size, method=Image.Resampling.LANCZOS)
-            img.save(output_path, "JPEG", quality=80)
-
     async def _generate_gif_thumbnail(self, input_path: Path, output_path: Path):
         """Generate an animated GIF thumbnail using ffmpeg."""
         if not self._ffmpeg_available:
@@ -127,38 +209,98 @@ class ThumbnailService:
                 '-vf', f'scale={self.thumb_size[0]}:-1:flags=lanczos',
                 str(output_path)
             ]
-            
-            proc = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.DEVNULL,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            try:
-                _, stderr = await asyncio.wait_for(proc.communicate(), timeout=30)
-                if proc.returncode != 0:
-                    print(f"ffmpeg gif generation error: {stderr.decode()}")
-            except asyncio.TimeoutError:
-                proc.kill()
-                print(f"ffmpeg timeout for {input_path}")
-                
+            await self._run_ffmpeg(cmd, timeout=30)
         except Exception as e:
             print(f"Error generating gif thumbnail for {input_path}: {e}")
 
     async def _generate_video_thumbnail(self, input_path: Path, output_path: Path):
-        """Generate a video thumbnail using ffmpeg with a timeout."""
+        """Generate a video thumbnail, sharing one ffmpeg run with concurrent requests.
+
+        Requests arriving within VIDEO_BATCH_WINDOW of each other (e.g. a
+        directory grid loading) are coalesced so ffmpeg's process start and
+        codec setup are paid once per batch instead of once per file.
+        """
+        loop = asyncio.get_event_loop()
+        done = loop.create_future()
+        self._video_batch.append((input_path, output_path, done))
+        if len(self._video_batch) >= VIDEO_BATCH_MAX:
+            self._flush_video_batch()
+        elif len(self._video_batch) == 1:
+            loop.call_later(VIDEO_BATCH_WINDOW, self._flush_video_batch)
+        await done
+
+    def _flush_video_batch(self):
+        """Hand the pending video requests to a background ffmpeg run."""
+        if not self._video_batch:
+            return
+        batch, self._video_batch = self._video_batch, []
+        task = asyncio.get_event_loop().create_task(self._run_video_batch(batch))
+        self._video_tasks.add(task)
+        task.add_done_callback(self._video_tasks.discard)
+
+    async def _run_video_batch(self, batch):
+        """Run one ffmpeg for the batch, retrying files singly if it fails."""
+        # The same video may be requested several times within one window
+        waiters = {}
+        for inp, out, done in batch:
+            waiters.setdefault((inp, out), []).append(done)
+
+        def resolve(pair):
+            for done in waiters[pair]:
+                if not done.done():
+                    done.set_result(None)
+
+        async def retry(pair):
+            try:
+                await self._run_ffmpeg(self._video_thumbnail_cmd([pair]), timeout=15)
+            finally:
+                resolve(pair)
+
         try:
-            # Use ffmpeg to extract first frame
-            cmd = [
-                'ffmpeg',
-                '-y',  # Overwrite output file without asking
-                '-i', str(input_path),
-                '-ss', '00:00:01',  # Seek to 1 second for a better frame
+            pairs = list(waiters)
+            ok = await self._run_ffmpeg(
+                self._video_thumbnail_cmd(pairs), timeout=15 + 2 * len(pairs)
+            )
+            if ok or len(pairs) == 1:
+                return
+            # One unreadable input aborts the whole run; isolate it. Files
+            # that did get written are released now, the rest retry in
+            # parallel (bounded by the ffmpeg semaphore).
+            retries = []
+            for pair in pairs:
+                if pair[1].exists():
+                    resolve(pair)
+                else:
+                    retries.append(retry(pair))
+            await asyncio.gather(*retries)
+        except Exception as e:
+            print(f"Error generating video thumbnails: {e}")
+        finally:
+            for _, _, done in batch:
+                if not done.done():
+                    done.set_result(None)
+
+    def _video_thumbnail_cmd(self, pairs):
+        """Build an ffmpeg command extracting one frame per (input, output) pair."""
+        cmd = ['ffmpeg', '-y']  # Overwrite output files without asking
+        for input_path, _ in pairs:
+            # Seek to 1 second for a better frame. As an input option this
+            # jumps to the nearest keyframe instead of decoding up to it.
+            cmd += ['-ss', '00:00:01', '-i', str(input_path)]
+        for i, (_, output_path) in enumerate(pairs):
+            cmd += [
+                '-map', f'{i}:v:0',
+                '-an', '-sn',  # no audio/subtitle processing
                 '-vframes', '1',
                 '-vf', f'scale={self.thumb_size[0]}:-1',  # maintain aspect ratio
-                str(output_path)
+                '-pix_fmt', 'yuvj420p',
+                str(output_path),
             ]
-            
+        return cmd
+
+    async def _run_ffmpeg(self, cmd, timeout: float) -> bool:
+        """Run an ffmpeg command with a timeout. Returns True on success."""
+        async with self._ffmpeg_slots:
             proc = await asyncio.create_subprocess_exec(
                 *cmd,
                 stdout=asyncio.subprocess.DEVNULL,
@@ -166,14 +308,15 @@ class ThumbnailService:
             )
             try:
                 # Add timeout to prevent hanging
-                stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=15)
-                if proc.returncode != 0:
-                    print(f"ffmpeg error: {stderr.decode()}")
+                _, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
             except asyncio.TimeoutError:
                 proc.kill()
-                print(f"ffmpeg timeout for {input_path}")
-            
-        except Exception as e:
-            print(f"Error generating video thumbnail for {input_path}: {e}")
+                await proc.wait()
+                print(f"ffmpeg timed out after {timeout}s")
+                return False
+        if proc.returncode != 0:
+            print(f"ffmpeg error: {stderr.decode(errors='replace')}")
+            return False
+        return True
 
 thumbnail_service = ThumbnailService()
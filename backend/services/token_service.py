@@ -2,18 +2,45 @@
 Sharing service for temporary download tokens.
 """
 
-import secrets
-from datetime import datetime, timedelta
-from typing import Dict, Optional
-from pydantic import BaseModel
+import heapq
+import time
+from base64 import urlsafe_b64encode
+from dataclasses import dataclass
+from datetime import datetime
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+from secrets import token_bytes
 
+# Seconds between sweeps of expired tokens
+CLEANUP_INTERVAL = 60
+# Lifetime of access and session tokens: 3 days of convenience
+SESSION_TTL = 72 * 3600
 
-class TokenInfo(BaseModel):
-    """Metadata for a sharing or access token."""
+
+def _new_token(nbytes: int) -> str:
+    """Same output as secrets.token_urlsafe, with the helper layers inlined."""
+    return urlsafe_b64encode(token_bytes(nbytes)).rstrip(b'=').decode('ascii')
+
+
+class TokenType(str, Enum):
+    """Kind of token. Members are str, so they still compare equal to 'share' etc."""
+    SHARE = "share"
+    ACCESS = "access"
+    SESSION = "session"
+
+
+@dataclass(slots=True)
+class TokenInfo:
+    """Metadata for a sharing or access token.
+
+    A plain slotted dataclass: one is created per token and kept in memory
+    until expiry, so it avoids a pydantic model's validation and overhead.
+    """
     username: str
-    filename: Optional[str] = None  # None for full access tokens
     expiry: datetime
-    token_type: str = "share" # 'share', 'access', or 'session'
+    expiry_ts: float  # Same instant as unix seconds, for cheap comparisons
+    filename: Optional[str] = None  # None for full access tokens
+    token_type: TokenType = TokenType.SHARE
 
 
 class TokenService:
@@ -26,7 +53,10 @@ class TokenService:
             expiry_hours: How long tokens remain valid.
         """
         self.expiry_hours = expiry_hours
+        self._share_ttl = expiry_hours * 3600
         self.tokens: Dict[str, TokenInfo] = {}
+        # Min-heap of (expiry_ts, token) so cleanup only touches expired entries
+        self._expiry_heap: List[Tuple[float, str]] = []
 
     def create_token(self, username: str, filename: str) -> str:
         """Create a new sharing token for a specific file.
@@ -38,15 +68,15 @@ class TokenService:
         Returns:
             A unique token string.
         """
-        token = secrets.token_urlsafe(32)
-        expiry = datetime.now() + timedelta(hours=self.expiry_hours)
-        self.tokens[token] = TokenInfo(
+        token = _new_token(32)
+        expiry_ts = time.time() + self._share_ttl
+        self._store(token, TokenInfo(
             username=username,
             filename=filename,
-            expiry=expiry,
-            token_type="share"
-        )
-        self._cleanup()
+            expiry=datetime.fromtimestamp(expiry_ts),
+            expiry_ts=expiry_ts,
+            token_type=TokenType.SHARE
+        ))
         return token
 
     def create_access_token(self, username: str) -> str:
@@ -58,15 +88,15 @@ class TokenService:
         Returns:
             A unique token string.
         """
-        token = secrets.token_urlsafe(32)
+        token = _new_token(32)
         # Use longer expiry for sessions to improve convenience
-        expiry = datetime.now() + timedelta(hours=72)
-        self.tokens[token] = TokenInfo(
+        expiry_ts = time.time() + SESSION_TTL
+        self._store(token, TokenInfo(
             username=username,
-            expiry=expiry,
-            token_type="access"
-        )
-        self._cleanup()
+            expiry=datetime.fromtimestamp(expiry_ts),
+            expiry_ts=expiry_ts,
+            token_type=TokenType.ACCESS
+        ))
         return token
 
     def create_session_token(self, username: str) -> str:
@@ -78,14 +108,14 @@ class TokenService:
         Returns:
             A unique session token string.
         """
-        token = secrets.token_urlsafe(64)
-        expiry = datetime.now() + timedelta(hours=72) # 3 days of convenience
-        self.tokens[token] = TokenInfo(
+        token = _new_token(64)
+        expiry_ts = time.time() + SESSION_TTL
+        self._store(token, TokenInfo(
             username=username,
-            expiry=expiry,
-            token_type="session"
-        )
-        self._cleanup()
+            expiry=datetime.fromtimestamp(expiry_ts),
+            expiry_ts=expiry_ts,
+            token_type=TokenType.SESSION
+        ))
         return token
 
     def validate_token(self, token: str) -> Optional[TokenInfo]:
@@ -104,19 +134,31 @@ class TokenService:
         if not info:
             return None
             
-        if datetime.now() > info.expiry:
-            del self.tokens[token]
+        if time.time() > info.expiry_ts:
+            self.tokens.pop(token, None)
             return None
             
         return info
 
-    def _cleanup(self) -> None:
-        """Remove expired tokens from memory."""
-        now = datetime.now()
-        # Create a list of keys to delete to avoid dictionary size change during iteration
-        expired = [t for t, info in self.tokens.items() if now > info.expiry]
-        for t in expired:
-            del self.tokens[t]
+    def _store(self, token: str, info: TokenInfo) -> None:
+        """Register a new token in the store and the expiry heap."""
+        self.tokens[token] = info
+        heapq.heappush(self._expiry_heap, (info.expiry_ts, token))
+
+    def cleanup(self) -> None:
+        """Remove expired tokens from memory.
+
+        Called periodically from the app lifespan rather than on every token
+        creation; validate_token rejects expired tokens in between sweeps.
+        """
+        now = time.time()
+        heap = self._expiry_heap
+        while heap and now > heap[0][0]:
+            _, token = heapq.heappop(heap)
+            # The token may already be gone (lazily deleted in validate_token)
+            info = self.tokens.get(token)
+            if info is not None and now > info.expiry_ts:
+                self.tokens.pop(token, None)
 
 
 # Singleton instance
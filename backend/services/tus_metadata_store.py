@@ -7,14 +7,70 @@ Uses SQLite for simplicity and reliability.
 
 import sqlite3
 import json
-from datetime import datetime
+import threading
+import time
 from pathlib import Path
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
 from contextlib import contextmanager
 import logging
 
 logger = logging.getLogger(__name__)
 
+# orjson is optional: it encodes/decodes the parts and metadata columns much
+# faster than the stdlib, which is used whenever it is not installed.
+try:
+    import orjson
+
+    def _dumps(value: Any) -> str:
+        return orjson.dumps(value).decode()
+
+    _loads = orjson.loads
+except ImportError:
+    _dumps = json.dumps
+    _loads = json.loads
+
+# Seconds between flushes of buffered offset updates
+OFFSET_FLUSH_INTERVAL = 0.25
+
+
+# Statements used on every upload request. Keeping them as constants makes
+# each call hand sqlite3 the identical string, so the per-connection
+# statement cache reuses the compiled statement instead of re-parsing it.
+# A new upload for a (fingerprint, username) that already has a finished
+# row takes that row over in place rather than deleting and re-inserting it
+_SQL_INSERT_UPLOAD = """
+    INSERT INTO tus_uploads (
+        id, fingerprint, username,
+        offset, size, filename, content_type, metadata,
+        parts, status, created_at, updated_at
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(fingerprint, username) DO UPDATE SET
+        id = excluded.id,
+        offset = excluded.offset,
+        size = excluded.size,
+        filename = excluded.filename,
+        content_type = excluded.content_type,
+        metadata = excluded.metadata,
+        parts = excluded.parts,
+        status = excluded.status,
+        created_at = excluded.created_at,
+        updated_at = excluded.updated_at
+"""
+# Explicit column order read positionally by _row_to_dict (this also skips
+# the legacy r2_upload_id/r2_key columns older databases may still have)
+_UPLOAD_COLUMNS = (
+    "id, fingerprint, username, offset, size, filename, content_type, "
+    "metadata, parts, status, created_at, updated_at"
+)
+_SQL_GET_BY_ID = f"SELECT {_UPLOAD_COLUMNS} FROM tus_uploads WHERE id = ?"
+_SQL_UPDATE_OFFSET = """
+    UPDATE tus_uploads 
+    SET offset = ?, parts = ?, updated_at = ?
+    WHERE id = ?
+"""
+_SQL_SET_STATUS = "UPDATE tus_uploads SET status = ?, updated_at = ? WHERE id = ?"
+_SQL_DELETE_UPLOAD = "DELETE FROM tus_uploads WHERE id = ?"
+
 
 class TusMetadataStore:
     """Stores TUS upload metadata for fingerprint-based resume detection."""
@@ -27,7 +83,18 @@ class TusMetadataStore:
         """
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # (fingerprint, username) -> id of its active upload, plus the reverse
+        # map; resume probes for unknown files never touch SQLite
+        self._fp_index: Dict[Tuple[str, str], str] = {}
+        self._fp_by_id: Dict[str, Tuple[str, str]] = {}
+        self._fp_lock = threading.Lock()
+        self._local = threading.local()
+        # Latest (offset, parts) per upload not yet written to SQLite
+        self._pending: Dict[str, Tuple[int, Optional[str]]] = {}
+        self._pending_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
         self._init_db()
+        self._load_fp_index()
     
     def _init_db(self) -> None:
         """Initialize database schema."""
@@ -44,8 +111,8 @@ class TusMetadataStore:
                     metadata TEXT,
                     parts TEXT,
                     status TEXT NOT NULL DEFAULT 'active',
-                    created_at TIMESTAMP NOT NULL,
-                    updated_at TIMESTAMP NOT NULL,
+                    created_at INTEGER NOT NULL,  -- unix seconds (UTC)
+                    updated_at INTEGER NOT NULL,
                     UNIQUE(fingerprint, username)
                 )
             """)
@@ -59,19 +126,71 @@ class TusMetadataStore:
                 CREATE INDEX IF NOT EXISTS idx_created_at 
                 ON tus_uploads(created_at)
             """)
+
+            # Lets cleanup_old_uploads range-scan each finished status
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_status_created
+                ON tus_uploads(status, created_at)
+            """)
+
+            # Older databases stored these as UTC datetime text; convert
+            # them so comparisons against integer cutoffs work.
+            for column in ("created_at", "updated_at"):
+                conn.execute(f"""
+                    UPDATE tus_uploads
+                    SET {column} = CAST(strftime('%s', {column}) AS INTEGER)
+                    WHERE typeof({column}) = 'text'
+                """)
             
             conn.commit()
     
+    def _load_fp_index(self) -> None:
+        """Populate the fingerprint index from all active uploads."""
+        with self._get_connection() as conn:
+            rows = conn.execute(
+                "SELECT id, fingerprint, username FROM tus_uploads WHERE status = 'active'"
+            ).fetchall()
+        with self._fp_lock:
+            for upload_id, fingerprint, username in rows:
+                self._index_upload(upload_id, fingerprint, username)
+
+    def _index_upload(self, upload_id: str, fingerprint: str, username: str) -> None:
+        """Point (fingerprint, username) at upload_id. Caller holds _fp_lock."""
+        key = (fingerprint, username)
+        previous = self._fp_index.get(key)
+        if previous is not None:
+            self._fp_by_id.pop(previous, None)
+        self._fp_index[key] = upload_id
+        self._fp_by_id[upload_id] = key
+
+    def _unindex_upload(self, upload_id: str) -> None:
+        """Drop upload_id from the fingerprint index if present."""
+        with self._fp_lock:
+            key = self._fp_by_id.pop(upload_id, None)
+            if key is not None and self._fp_index.get(key) == upload_id:
+                del self._fp_index[key]
+
     @contextmanager
     def _get_connection(self):
-        """Get database connection with context manager."""
-        conn = sqlite3.connect(str(self.db_path), timeout=30.0) # Increase timeout
-        conn.execute("PRAGMA journal_mode=WAL") # Enable WAL mode for concurrency
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-        finally:
-            conn.close()
+        """Get this thread's database connection with context manager.
+
+        Connections are opened once per thread and kept for the life of the
+        process, so each call skips the open and PRAGMA setup. They run in
+        autocommit mode, so a failed statement never leaves a transaction
+        holding the write lock.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                str(self.db_path), timeout=30.0, isolation_level=None,
+                cached_statements=256,
+            )
+            conn.execute("PRAGMA journal_mode=WAL") # Enable WAL mode for concurrency
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
+            self._local.conn = conn
+        yield conn
     
     def create_upload(
         self,
@@ -97,17 +216,11 @@ class TusMetadataStore:
         Returns:
             Created upload record dict, or None on failure.
         """
-        now = datetime.utcnow()
+        now = int(time.time())
         
         with self._get_connection() as conn:
             try:
-                conn.execute("""
-                    INSERT OR REPLACE INTO tus_uploads (
-                        id, fingerprint, username,
-                        offset, size, filename, content_type, metadata,
-                        parts, status, created_at, updated_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
+                conn.execute(_SQL_INSERT_UPLOAD, (
                     upload_id,
                     fingerprint,
                     username,
@@ -115,8 +228,8 @@ class TusMetadataStore:
                     size,
                     filename,
                     content_type,
-                    json.dumps(metadata or {}),
-                    json.dumps([]),
+                    _dumps(metadata or {}),
+                    _dumps([]),
                     'active',
                     now,
                     now
@@ -125,16 +238,30 @@ class TusMetadataStore:
             except Exception as e:
                 logger.error(f"Failed to create upload record: {e}")
                 return None
-        
-        return self.get_upload(upload_id)
+
+        # The upsert may have displaced an older upload for this key
+        with self._fp_lock:
+            self._index_upload(upload_id, fingerprint, username)
+        # Every column was just written, so build the record without re-reading it
+        return {
+            'id': upload_id,
+            'fingerprint': fingerprint,
+            'username': username,
+            'offset': 0,
+            'size': size,
+            'filename': filename,
+            'content_type': content_type,
+            'metadata': metadata or {},
+            'parts': [],
+            'status': 'active',
+            'created_at': now,
+            'updated_at': now
+        }
     
     def get_upload(self, upload_id: str) -> Optional[Dict[str, Any]]:
         """Get upload record by ID."""
         with self._get_connection() as conn:
-            row = conn.execute(
-                "SELECT * FROM tus_uploads WHERE id = ?",
-                (upload_id,)
-            ).fetchone()
+            row = conn.execute(_SQL_GET_BY_ID, (upload_id,)).fetchone()
             
             if not row:
                 return None
@@ -155,81 +282,137 @@ class TusMetadataStore:
         Returns:
             Upload record dict or None.
         """
-        with self._get_connection() as conn:
-            row = conn.execute("""
-                SELECT * FROM tus_uploads 
-                WHERE fingerprint = ? AND username = ? AND status = 'active'
-                ORDER BY created_at DESC
-                LIMIT 1
-            """, (fingerprint, username)).fetchone()
-            
-            if not row:
-                return None
-            
-            return self._row_to_dict(row)
+        # The index holds every active upload (loaded at startup, maintained
+        # on every write), so a miss is authoritative and needs no SQL. This
+        # assumes this store is the only writer, as in the single-process server.
+        with self._fp_lock:
+            upload_id = self._fp_index.get((fingerprint, username))
+        if upload_id is None:
+            return None
+
+        upload = self.get_upload(upload_id)
+        if (upload and upload['status'] == 'active'
+                and upload['fingerprint'] == fingerprint
+                and upload['username'] == username):
+            return upload
+        # Row changed underneath the index (e.g. removed by hand); forget it
+        self._unindex_upload(upload_id)
+        return None
     
     def update_offset(
         self,
         upload_id: str,
         offset: int,
         parts: Optional[List[Dict[str, Any]]] = None
-    ) -> bool:
-        """Update upload offset and parts list."""
+    ) -> None:
+        """Update upload offset and parts list.
+
+        The update is buffered and written together with other pending
+        updates every OFFSET_FLUSH_INTERVAL seconds, so a stream of PATCH
+        requests costs one commit per interval instead of one per chunk.
+        Reads through this store see the buffered value immediately.
+
+        Nothing is returned: the row is not touched until the flush, and a
+        crash before it leaves the stored offset behind the data on disk.
+        Writers must therefore write at the client's offset (not append)
+        so a resent chunk overwrites rather than duplicates.
+        """
+        with self._pending_lock:
+            self._pending[upload_id] = (
+                offset, _dumps(parts) if parts is not None else None
+            )
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name="tus-offset-flush", daemon=True
+                )
+                self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        """Background thread body: periodically persist buffered offsets."""
+        while True:
+            time.sleep(OFFSET_FLUSH_INTERVAL)
+            try:
+                self.flush_pending()
+            except Exception as e:
+                logger.error(f"Failed to flush upload offsets: {e}")
+
+    def flush_pending(self, upload_id: Optional[str] = None) -> None:
+        """Write buffered offset updates to SQLite in one transaction.
+
+        Args:
+            upload_id: Flush only this upload; all pending updates if None.
+        """
+        # Entries stay buffered until the COMMIT, so reads in between still
+        # see them instead of the older committed offset
+        with self._pending_lock:
+            if upload_id is None:
+                pending = dict(self._pending)
+            elif upload_id in self._pending:
+                pending = {upload_id: self._pending[upload_id]}
+            else:
+                return
+        if not pending:
+            return
+
+        now = int(time.time())
         with self._get_connection() as conn:
-            cursor = conn.execute("""
-                UPDATE tus_uploads 
-                SET offset = ?, parts = ?, updated_at = ?
-                WHERE id = ?
-            """, (
-                offset,
-                json.dumps(parts) if parts is not None else None,
-                datetime.utcnow(),
-                upload_id
-            ))
-            conn.commit()
-            return cursor.rowcount > 0
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(_SQL_UPDATE_OFFSET, [
+                    (offset, parts, now, uid)
+                    for uid, (offset, parts) in pending.items()
+                ])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise  # Entries are still buffered; the next flush retries
+        with self._pending_lock:
+            for uid, value in pending.items():
+                # Keep entries replaced by a newer update_offset meanwhile
+                if self._pending.get(uid) is value:
+                    del self._pending[uid]
     
     def mark_completed(self, upload_id: str) -> bool:
         """Mark upload as completed."""
+        self._unindex_upload(upload_id)
+        self.flush_pending(upload_id)
         with self._get_connection() as conn:
-            cursor = conn.execute("""
-                UPDATE tus_uploads 
-                SET status = 'completed', updated_at = ?
-                WHERE id = ?
-            """, (datetime.utcnow(), upload_id))
+            cursor = conn.execute(
+                _SQL_SET_STATUS, ('completed', int(time.time()), upload_id)
+            )
             conn.commit()
             return cursor.rowcount > 0
     
     def mark_aborted(self, upload_id: str) -> bool:
         """Mark upload as aborted."""
+        self._unindex_upload(upload_id)
+        self.flush_pending(upload_id)
         with self._get_connection() as conn:
-            cursor = conn.execute("""
-                UPDATE tus_uploads 
-                SET status = 'aborted', updated_at = ?
-                WHERE id = ?
-            """, (datetime.utcnow(), upload_id))
+            cursor = conn.execute(
+                _SQL_SET_STATUS, ('aborted', int(time.time()), upload_id)
+            )
             conn.commit()
             return cursor.rowcount > 0
     
     def delete_upload(self, upload_id: str) -> bool:
         """Delete upload record."""
+        self._unindex_upload(upload_id)
+        with self._pending_lock:
+            self._pending.pop(upload_id, None)
         with self._get_connection() as conn:
-            cursor = conn.execute(
-                "DELETE FROM tus_uploads WHERE id = ?",
-                (upload_id,)
-            )
+            cursor = conn.execute(_SQL_DELETE_UPLOAD, (upload_id,))
             conn.commit()
             return cursor.rowcount > 0
     
     def cleanup_old_uploads(self, days: int = 7) -> int:
         """Clean up old completed/aborted uploads."""
-        cutoff = datetime.utcnow().timestamp() - (days * 24 * 3600)
+        cutoff = int(time.time()) - days * 24 * 3600
         
         with self._get_connection() as conn:
             cursor = conn.execute("""
                 DELETE FROM tus_uploads 
                 WHERE status IN ('completed', 'aborted') 
-                AND created_at < datetime(?, 'unixepoch')
+                AND created_at < ?
             """, (cutoff,))
             conn.commit()
             return cursor.rowcount
@@ -243,7 +426,7 @@ class TusMetadataStore:
         Returns:
             List of upload IDs that were deleted.
         """
-        cutoff = datetime.utcnow().timestamp() - (days * 24 * 3600)
+        cutoff = int(time.time()) - days * 24 * 3600
         
         deleted_ids = []
         with self._get_connection() as conn:
@@ -251,10 +434,10 @@ class TusMetadataStore:
             rows = conn.execute("""
                 SELECT id FROM tus_uploads 
                 WHERE status = 'active' 
-                AND updated_at < datetime(?, 'unixepoch')
+                AND updated_at < ?
             """, (cutoff,)).fetchall()
             
-            expired_ids = [row['id'] for row in rows]
+            expired_ids = [row[0] for row in rows]
             
             if expired_ids:
                 # Delete them
@@ -265,23 +448,37 @@ class TusMetadataStore:
                 """, expired_ids)
                 conn.commit()
                 deleted_ids = expired_ids
+
+        for upload_id in deleted_ids:
+            self._unindex_upload(upload_id)
+            with self._pending_lock:
+                self._pending.pop(upload_id, None)
         
         return deleted_ids
     
-    def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
-        """Convert SQLite row to dictionary."""
+    def _row_to_dict(self, row: Tuple) -> Dict[str, Any]:
+        """Convert a row selected with _UPLOAD_COLUMNS to a dictionary.
+
+        Any buffered offset update for the upload is applied on top.
+        """
+        (upload_id, fingerprint, username, offset, size, filename,
+         content_type, metadata, parts, status, created_at, updated_at) = row
+        with self._pending_lock:
+            pending = self._pending.get(upload_id)
+        if pending is not None:
+            offset, parts = pending
         return {
-            'id': row['id'],
-            'fingerprint': row['fingerprint'],
-            'username': row['username'],
+            'id': upload_id,
+            'fingerprint': fingerprint,
+            'username': username,
             # r2_upload_id and r2_key are legacy/unused, omitted from dict
-            'offset': row['offset'],
-            'size': row['size'],
-            'filename': row['filename'],
-            'content_type': row['content_type'],
-            'metadata': json.loads(row['metadata']) if row['metadata'] else {},
-            'parts': json.loads(row['parts']) if row['parts'] else [],
-            'status': row['status'],
-            'created_at': row['created_at'],
-            'updated_at': row['updated_at']
+            'offset': offset,
+            'size': size,
+            'filename': filename,
+            'content_type': content_type,
+            'metadata': _loads(metadata) if metadata else {},
+            'parts': _loads(parts) if parts else [],
+            'status': status,
+            'created_at': created_at,
+            'updated_at': updated_at
         }
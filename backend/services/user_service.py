@@ -241,7 +241,7 @@ class UserService:
         if new_username and new_username != old_username:
             # Check collision
             dup = await db.execute(
-                "SELECT id FROM users WHERE username = ?", (new_username,)
+                "SELECT 1 FROM users WHERE username = ? LIMIT 1", (new_username,)
             )
             if await dup.fetchone():
                 raise ValueError(f"節點代碼 {new_username} 已被佔用。")
@@ -253,6 +253,8 @@ class UserService:
                 new_path = settings.paths.upload_folder / new_username
                 if old_path.exists() and not new_path.exists():
                     old_path.rename(new_path)
+                    from backend.services.file_service import file_service
+                    file_service.invalidate_dir_cache(old_path)
                     updates["folder"] = new_username
             updates["username"] = new_username
 
@@ -323,6 +325,8 @@ class UserService:
                 import shutil
                 loop = asyncio.get_event_loop()
                 await loop.run_in_executor(None, shutil.rmtree, folder_path)
+                from backend.services.file_service import file_service
+                file_service.invalidate_dir_cache(folder_path)
 
         return True
 
@@ -441,8 +445,8 @@ class UserService:
 
         # Check duplicate name in same parent
         dup = await db.execute(
-            "SELECT id FROM folders WHERE user_id = ? AND name = ? AND "
-            "(parent_id = ? OR (parent_id IS NULL AND ? IS NULL))",
+            "SELECT 1 FROM folders WHERE user_id = ? AND name = ? AND "
+            "(parent_id = ? OR (parent_id IS NULL AND ? IS NULL)) LIMIT 1",
             (user_id, name, parent_id, parent_id),
         )
         if await dup.fetchone():
@@ -489,8 +493,8 @@ class UserService:
 
         # Check duplicate name in same parent (excluding self)
         dup = await db.execute(
-            "SELECT id FROM folders WHERE user_id = ? AND name = ? AND id != ? AND "
-            "(parent_id = ? OR (parent_id IS NULL AND ? IS NULL))",
+            "SELECT 1 FROM folders WHERE user_id = ? AND name = ? AND id != ? AND "
+            "(parent_id = ? OR (parent_id IS NULL AND ? IS NULL)) LIMIT 1",
             (folder["user_id"], name, folder_id, folder["parent_id"], folder["parent_id"]),
         )
         if await dup.fetchone():
@@ -514,8 +518,8 @@ class UserService:
         """
         db = await get_users_db()
         cursor = await db.execute(
-            "SELECT f.id FROM folders f JOIN users u ON f.user_id = u.id "
-            "WHERE f.id = ? AND u.username = ?",
+            "SELECT 1 FROM folders f JOIN users u ON f.user_id = u.id "
+            "WHERE f.id = ? AND u.username = ? LIMIT 1",
             (folder_id, username),
         )
         if not await cursor.fetchone():
@@ -668,8 +672,8 @@ class UserService:
         """
         db = await get_users_db()
         cursor = await db.execute(
-            "SELECT f.id FROM folders f JOIN users u ON f.user_id = u.id "
-            "WHERE f.id = ? AND u.username = ?",
+            "SELECT 1 FROM folders f JOIN users u ON f.user_id = u.id "
+            "WHERE f.id = ? AND u.username = ? LIMIT 1",
             (folder_id, username),
         )
         if not await cursor.fetchone():